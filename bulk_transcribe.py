@@ -0,0 +1,230 @@
+"""Пакетное распознавание архива записей без Telegram.
+
+Примеры:
+    python bulk_transcribe.py /data/archive -o results.jsonl
+    python bulk_transcribe.py manifest.txt -o results.jsonl --workers 4 --mode process
+
+Вход — каталог (файлы ищутся рекурсивно) или манифест: текстовый файл
+со списком путей либо JSONL с полем "path". Результаты дописываются в
+JSONL по мере готовности; при повторном запуске уже распознанные файлы
+пропускаются.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from pathlib import Path
+
+from speech_recognizer_fast import SpeechRecognizerFast, VIDEO_EXTENSIONS
+
+
+logger = logging.getLogger("bulk")
+
+AUDIO_EXTENSIONS = ['.ogg', '.oga', '.mp3', '.wav', '.m4a', '.flac']
+
+
+def collect_files(source: Path) -> list:
+    """Список файлов из каталога или манифеста."""
+    if source.is_dir():
+        extensions = set(AUDIO_EXTENSIONS + VIDEO_EXTENSIONS)
+        return sorted(
+            p.resolve() for p in source.rglob("*")
+            if p.is_file() and p.suffix.lower() in extensions
+        )
+
+    files = []
+    with open(source, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                line = json.loads(line)["path"]
+            path = Path(line)
+            # Относительные пути в манифесте — относительно самого манифеста
+            if not path.is_absolute():
+                path = source.parent / path
+            files.append(path.resolve())
+    return files
+
+
+def load_done(output: Path) -> set:
+    """Пути, которые уже успешно распознаны в прошлых запусках.
+
+    Пути абсолютные, поэтому запуск из другого каталога или с другим
+    написанием того же источника не распознаёт архив заново.
+    """
+    done = set()
+    if not output.exists():
+        return done
+    with open(output, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Строка, оборванная при аварийной остановке
+                continue
+            if record.get("status") == "done":
+                done.add(str(Path(record["path"]).resolve()))
+    return done
+
+
+def _init_worker(cpu_threads: int, num_workers: int):
+    """Настройка модели в процессе-воркере до её загрузки."""
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+    manager = SpeechRecognizerFast._model_manager
+    manager.cpu_threads = cpu_threads
+    manager.num_workers = num_workers
+
+
+def transcribe_one(path: str) -> dict:
+    """Распознаёт один файл; исходник не удаляется."""
+    start_time = time.time()
+    try:
+        result = SpeechRecognizerFast.transcribe(Path(path), keep_input=True)
+    except Exception as e:
+        return {
+            "path": path,
+            "status": "failed",
+            "error": str(e),
+            "worker": f"{socket.gethostname()}-{os.getpid()}",
+        }
+    return {
+        "path": path,
+        "status": "done",
+        "text": result["text"],
+        "segments": result["segments"],
+        "audio_duration": result["audio_duration"],
+        "processing_time": round(time.time() - start_time, 2),
+        "worker": f"{socket.gethostname()}-{os.getpid()}",
+    }
+
+
+def run(files: list, output: Path, workers: int, mode: str, cpu_threads: int) -> dict:
+    """Распознаёт файлы пулом воркеров и дописывает результаты в output."""
+    if mode == "process":
+        # Каждый процесс загружает свою модель и использует cpu_threads ядер
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(cpu_threads, 1),
+        )
+    else:
+        # Одна модель на все потоки; ctranslate2 выполняет до num_workers
+        # распознаваний параллельно
+        _init_worker(cpu_threads, workers)
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    stats = {"done": 0, "failed": 0, "audio_seconds": 0.0}
+    total = len(files)
+    started = time.time()
+
+    with executor, open(output, "a", encoding="utf-8") as out:
+        futures = [executor.submit(transcribe_one, str(p)) for p in files]
+        try:
+            for i, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+                stats[record["status"]] += 1
+                if record["status"] == "done":
+                    stats["audio_seconds"] += record["audio_duration"] or 0
+                else:
+                    logger.error("%s: %s", record["path"], record["error"])
+
+                elapsed = time.time() - started
+                logger.info(
+                    "[%d/%d] %s: %s (%.0f файлов/ч)", i, total,
+                    record["status"], record["path"], i / elapsed * 3600)
+        except KeyboardInterrupt:
+            logger.warning("Остановка: готовые результаты уже записаны.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    stats["wall_seconds"] = time.time() - started
+    return stats
+
+
+def print_summary(stats: dict, skipped: int):
+    wall_hours = stats["wall_seconds"] / 3600
+    processed = stats["done"] + stats["failed"]
+    files_per_hour = processed / wall_hours if wall_hours else 0.0
+    audio_hours = stats["audio_seconds"] / 3600
+    audio_per_hour = audio_hours / wall_hours if wall_hours else 0.0
+
+    print(f"Распознано: {stats['done']}, ошибок: {stats['failed']}, "
+          f"пропущено (уже готово): {skipped}")
+    print(f"Время работы: {stats['wall_seconds']:.1f} сек., "
+          f"аудио: {audio_hours:.2f} ч")
+    print(f"Пропускная способность: {files_per_hour:.1f} файлов/ч, "
+          f"{audio_per_hour:.2f} ч аудио за час работы")
+
+
+def main(argv=None):
+    cpu_count = os.cpu_count() or 1
+
+    parser = argparse.ArgumentParser(
+        description="Пакетное распознавание каталога или манифеста в JSONL.")
+    parser.add_argument("source", type=Path,
+                        help="каталог с записями или файл-манифест")
+    parser.add_argument("-o", "--output", type=Path, default=Path("transcripts.jsonl"),
+                        help="файл результатов JSONL (дописывается)")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="количество параллельных распознаваний "
+                             "(по умолчанию четверть ядер CPU, на GPU — 2)")
+    parser.add_argument("--mode", choices=["process", "thread"],
+                        help="process — модель в каждом процессе, thread — одна общая модель "
+                             "(по умолчанию process на CPU, thread на GPU)")
+    parser.add_argument("--cpu-threads", type=int, default=0,
+                        help="потоков ctranslate2 на воркер (по умолчанию ядра делятся поровну)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    )
+
+    if not args.source.exists():
+        parser.error(f"не найдено: {args.source}")
+
+    # На GPU каждый процесс загрузил бы свою копию модели в одну видеопамять
+    on_gpu = SpeechRecognizerFast._model_manager.device == "cuda"
+    mode = args.mode or ("thread" if on_gpu else "process")
+    default_workers = 2 if on_gpu else max(1, cpu_count // 4)
+    workers = max(1, args.workers or default_workers)
+    if on_gpu and mode == "process" and workers > 1:
+        logger.warning(
+            "Режим process на GPU: %d копий модели в видеопамяти одной карты.", workers)
+    cpu_threads = args.cpu_threads or max(1, cpu_count // workers)
+
+    files = collect_files(args.source)
+    done = load_done(args.output)
+    pending = [p for p in files if str(p) not in done]
+    skipped = len(files) - len(pending)
+    logger.info(
+        "Файлов: %d, уже готово: %d, к распознаванию: %d "
+        "(%d воркеров, режим %s, %d потоков на воркер)",
+        len(files), skipped, len(pending), workers, mode, cpu_threads)
+
+    if not pending:
+        print("Все файлы уже распознаны.")
+        return 0
+
+    stats = run(pending, args.output, workers, mode, cpu_threads)
+    print_summary(stats, skipped)
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
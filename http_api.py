@@ -0,0 +1,365 @@
+import email.parser
+import email.policy
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+from tracing import span, trace_context
+
+
+logger = logging.getLogger("http_api")
+
+UPLOAD_PATH = Path("audio_files/api")
+
+SUPPORTED_EXTENSIONS = ['.ogg', '.oga', '.mp3', '.wav', '.m4a', '.flac',
+                        '.mp4', '.mov', '.mkv']
+
+MAX_UPLOAD_BYTES = int(os.getenv("HTTP_API_MAX_UPLOAD_MB", "100")) * 1024 * 1024
+
+# Сколько секунд хранить завершённые пакеты для опроса
+BATCH_TTL = 3600
+
+# Интервал пустых событий в потоке, чтобы соединение не закрывалось по таймауту
+PING_INTERVAL = 15
+
+
+class ApiJob:
+    """Задача из HTTP API. Интерфейс совпадает с задачами из Telegram:
+    started(), on_segment(), done(), failed() вызываются воркером."""
+
+    source = "api"
+    chat_id = None
+    reply_to = None
+
+    def __init__(self, file_name: str, stream: bool = True):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.file_name = file_name
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.duration = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = queue.Queue()
+        self._streamed = 0
+        if not stream:
+            # В пакетном режиме сегменты отдаются только целиком
+            self.on_segment = None
+
+    def started(self):
+        self.status = "running"
+        self.events.put({"event": "started"})
+
+    def on_segment(self, segment: dict):
+        self._streamed += 1
+        self.events.put({"event": "segment", **segment})
+
+    def done(self, result: dict, duration: float):
+        # Через брокер сегменты приходят только вместе с результатом
+        for segment in result.get("segments", [])[self._streamed:]:
+            self.events.put({"event": "segment", **segment})
+        self.result = result
+        self.duration = duration
+        self.status = "done"
+        self.finished_at = time.time()
+        self.events.put({
+            "event": "done",
+            "text": result["text"],
+            "audio_duration": result.get("audio_duration"),
+            "duration": round(duration, 2),
+        })
+
+    def failed(self, error: str):
+        self.error = error
+        self.status = "failed"
+        self.finished_at = time.time()
+        self.events.put({"event": "error", "error": error})
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+        }
+        if self.status == "done":
+            data["text"] = self.result["text"]
+            data["segments"] = self.result.get("segments", [])
+            data["audio_duration"] = self.result.get("audio_duration")
+            data["duration"] = round(self.duration, 2)
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class ApiServer:
+    """Локальный HTTP API поверх той же очереди и модели, что и бот.
+
+    POST /v1/transcribe   — один файл, ответ потоком NDJSON по мере распознавания
+    POST /v1/batches      — несколько файлов (multipart/form-data), возвращает batch_id
+    GET  /v1/batches/<id> — статус и результаты пакета
+    GET  /healthz         — процесс жив; загружена ли модель
+    GET  /readyz          — 200, если можно принимать задачи (модель загрузится при необходимости)
+    """
+
+    def __init__(
+        self,
+        submit_job: Callable,
+        queue_size: Callable[[], int],
+        get_status: Callable[[], dict],
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        token: Optional[str] = None
+    ):
+        self.submit_job = submit_job
+        self.queue_size = queue_size
+        self.get_status = get_status
+        self.host = host
+        self.port = port
+        self.token = token
+        self.batches = {}
+        self._batches_lock = threading.Lock()
+        self._httpd = None
+        UPLOAD_PATH.mkdir(parents=True, exist_ok=True)
+
+    def start(self):
+        handler = type("BoundApiHandler", (ApiHandler,), {"api": self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(
+            target=self._httpd.serve_forever, daemon=True).start()
+        logger.info("HTTP API запущен на %s:%s", self.host, self.port)
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+
+    def enqueue(self, file_name: str, data: bytes, stream: bool = True) -> ApiJob:
+        """Сохраняет загруженный файл и ставит его в общую очередь."""
+        job = ApiJob(file_name, stream=stream)
+        file_path = UPLOAD_PATH / f"{job.job_id}_{file_name}"
+        with trace_context(job.job_id), span("api.upload", size=len(data)):
+            with open(file_path, "wb") as f:
+                f.write(data)
+            self.submit_job(job, file_path)
+        return job
+
+    def create_batch(self, jobs: list) -> str:
+        batch_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._batches_lock:
+            # Удаляем давно завершённые пакеты
+            for old_id, batch in list(self.batches.items()):
+                finished = [j.finished_at for j in batch["jobs"]]
+                if all(finished) and now - max(finished) > BATCH_TTL:
+                    del self.batches[old_id]
+            self.batches[batch_id] = {"created_at": now, "jobs": jobs}
+        return batch_id
+
+    def get_batch(self, batch_id: str) -> Optional[dict]:
+        with self._batches_lock:
+            batch = self.batches.get(batch_id)
+        if batch is None:
+            return None
+        jobs = [job.to_dict() for job in batch["jobs"]]
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        for job in jobs:
+            counts[job["status"]] += 1
+        finished = counts["done"] + counts["failed"] == len(jobs)
+        return {
+            "batch_id": batch_id,
+            "status": "done" if finished else "running",
+            "counts": counts,
+            "jobs": jobs,
+        }
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    api: ApiServer = None
+
+    def log_message(self, format, *args):
+        logger.info("%s " + format, self.address_string(), *args)
+
+    # ── Маршруты
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if path in ("/healthz", "/readyz"):
+            try:
+                status = self.api.get_status()
+            except Exception as e:
+                # Например, база брокера недоступна
+                logger.exception("Ошибка получения состояния")
+                self._send_json(503, {"ready": False, "error": str(e)})
+                return
+            code = 200 if path == "/healthz" or status.get("ready") else 503
+            self._send_json(code, status)
+            return
+
+        if not self._check_auth():
+            return
+
+        if path.startswith("/v1/batches/"):
+            batch = self.api.get_batch(path.rsplit("/", 1)[-1])
+            if batch is None:
+                self._send_json(404, {"error": "Пакет не найден."})
+            else:
+                self._send_json(200, batch)
+            return
+
+        self._send_json(404, {"error": "Неизвестный адрес."})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip("/")
+        if not self._check_auth():
+            return
+
+        if path == "/v1/transcribe":
+            self._handle_transcribe()
+        elif path == "/v1/batches":
+            self._handle_batch()
+        else:
+            self._send_json(404, {"error": "Неизвестный адрес."})
+
+    # ── Обработчики
+
+    def _handle_transcribe(self):
+        files = self._read_files()
+        if files is None:
+            return
+        if len(files) != 1:
+            self._send_json(400, {"error": "Нужен ровно один файл."})
+            return
+
+        file_name, data = files[0]
+        position = self.api.queue_size()
+        job = self.api.enqueue(file_name, data)
+        logger.info("API: задача %s (%s) в очереди", job.job_id, file_name)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        try:
+            self._write_chunk(
+                {"event": "queued", "job_id": job.job_id, "position": position})
+            while True:
+                try:
+                    event = job.events.get(timeout=PING_INTERVAL)
+                except queue.Empty:
+                    self._write_chunk({"event": "ping"})
+                    continue
+                self._write_chunk(event)
+                if event["event"] in ("done", "error"):
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент ушёл — задача всё равно доработает в очереди
+            logger.warning("API: клиент отключился от задачи %s", job.job_id)
+            self.close_connection = True
+
+    def _handle_batch(self):
+        files = self._read_files(multipart_only=True)
+        if files is None:
+            return
+        if not files:
+            self._send_json(400, {"error": "Файлы не переданы."})
+            return
+
+        jobs = [self.api.enqueue(name, data, stream=False)
+                for name, data in files]
+        batch_id = self.api.create_batch(jobs)
+        logger.info("API: пакет %s из %s файлов в очереди", batch_id, len(jobs))
+        self._send_json(202, {
+            "batch_id": batch_id,
+            "jobs": [job.job_id for job in jobs],
+        })
+
+    # ── Вспомогательные методы
+
+    def _check_auth(self) -> bool:
+        if not self.api.token:
+            return True
+        if self.headers.get("Authorization") == f"Bearer {self.api.token}":
+            return True
+        self._send_json(401, {"error": "Неверный токен."})
+        return False
+
+    def _read_files(self, multipart_only: bool = False) -> Optional[list]:
+        """Читает тело запроса: multipart/form-data или «сырой» файл с ?filename=."""
+        length = self.headers.get("Content-Length")
+        if length is None:
+            self._send_json(411, {"error": "Нужен заголовок Content-Length."})
+            return None
+        try:
+            length = int(length)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send_json(400, {"error": "Некорректный Content-Length."})
+            self.close_connection = True
+            return None
+        if length > MAX_UPLOAD_BYTES:
+            self._send_json(413, {"error": "Файл слишком большой."})
+            self.close_connection = True
+            return None
+        body = self.rfile.read(length)
+
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/form-data"):
+            files = _parse_multipart(content_type, body)
+        elif multipart_only:
+            self._send_json(
+                415, {"error": "Ожидается multipart/form-data."})
+            return None
+        else:
+            query = parse_qs(urlparse(self.path).query)
+            file_name = query.get("filename", [""])[0]
+            files = [(file_name, body)]
+
+        checked = []
+        for file_name, data in files:
+            file_name = Path(file_name).name
+            extension = Path(file_name).suffix.lower()
+            if extension not in SUPPORTED_EXTENSIONS:
+                self._send_json(415, {
+                    "error": f"Формат файла {extension or '(нет)'} не поддерживается.",
+                    "supported": SUPPORTED_EXTENSIONS,
+                })
+                return None
+            checked.append((file_name, data))
+        return checked
+
+    def _send_json(self, code: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, event: dict):
+        data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def _parse_multipart(content_type: str, body: bytes) -> list:
+    """Возвращает [(имя файла, содержимое)] из тела multipart/form-data."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+    files = []
+    for part in message.iter_parts():
+        file_name = part.get_filename()
+        if file_name:
+            files.append((file_name, part.get_payload(decode=True)))
+    return files
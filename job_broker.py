@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobBroker:
+    """Очередь задач на распознавание в SQLite, общая для бота и воркеров.
+
+    Бот (front-end) кладёт задачи через submit(), любое количество
+    процессов-воркеров забирает их через claim(). Захваченная задача
+    «арендуется» на lease_timeout секунд; воркер продлевает аренду через
+    heartbeat(). Если воркер умер и аренда истекла, задача снова
+    выдаётся другому воркеру (не более max_attempts раз).
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        lease_timeout: int = 300,
+        max_attempts: int = 3
+    ):
+        self.db_path = Path(db_path)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    source TEXT NOT NULL DEFAULT 'telegram',
+                    chat_id INTEGER,
+                    reply_to INTEGER,
+                    file_path TEXT NOT NULL,
+                    file_type TEXT,
+                    file_unique_id TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_until REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    start_notified INTEGER NOT NULL DEFAULT 0,
+                    delivered INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+            # Базы, созданные до появления колонки
+            columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+            if "file_unique_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN file_unique_id TEXT")
+
+    def submit(
+        self,
+        file_path: Path,
+        chat_id: Optional[int] = None,
+        reply_to: Optional[int] = None,
+        file_type: Optional[str] = None,
+        source: str = "telegram",
+        job_id: Optional[str] = None,
+        file_unique_id: Optional[str] = None
+    ) -> str:
+        """Ставит файл в очередь и возвращает id задачи."""
+        job_id = job_id or uuid.uuid4().hex[:12]
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, source, chat_id, reply_to, file_path, file_type, "
+                "file_unique_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source, chat_id, reply_to,
+                 str(file_path), file_type, file_unique_id, time.time())
+            )
+        logger.info("Задача %s поставлена в очередь: %s", job_id, file_path)
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """Забирает самую старую задачу из очереди (или задачу умершего воркера)."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn, now)
+
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, "
+                "attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_timeout, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job["attempts"] += 1
+        logger.info(
+            "Задача %s выдана воркеру %s (попытка %d)", job["id"], worker_id, job["attempts"])
+        return job
+
+    def _expire_leases(self, conn: sqlite3.Connection, now: float):
+        """Возвращает в очередь задачи, аренда которых истекла."""
+        expired = conn.execute(
+            "SELECT id, worker_id, attempts FROM jobs "
+            "WHERE status = 'running' AND lease_until < ?",
+            (now,)
+        ).fetchall()
+        for row in expired:
+            if row["attempts"] >= self.max_attempts:
+                logger.error(
+                    "Задача %s не выполнена после %d попыток.", row["id"], row["attempts"])
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ?, "
+                    "worker_id = NULL, lease_until = NULL WHERE id = ?",
+                    ("Воркер не ответил, попытки исчерпаны.", now, row["id"])
+                )
+            else:
+                logger.warning(
+                    "Воркер %s не продлил задачу %s — возвращаю в очередь.",
+                    row["worker_id"], row["id"])
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL, "
+                    "lease_until = NULL WHERE id = ?",
+                    (row["id"],)
+                )
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Продлевает аренду задачи. False — задача уже отдана другому воркеру."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_until = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + self.lease_timeout, job_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> bool:
+        return self._finish(job_id, worker_id, "done", result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        return self._finish(job_id, worker_id, "failed", error=error)
+
+    def _finish(self, job_id: str, worker_id: str, status: str,
+                result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+                "lease_until = NULL WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id, worker_id)
+            )
+        if cur.rowcount != 1:
+            logger.warning(
+                "Результат задачи %s от %s отброшен: задача уже передана другому воркеру.",
+                job_id, worker_id)
+            return False
+        return True
+
+    def fetch_started(self, limit: int = 20) -> list:
+        """Задачи, взятые в работу, о которых ещё не сообщили пользователю."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'running' AND start_notified = 0 "
+                "ORDER BY started_at LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def mark_start_notified(self, job_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET start_notified = 1 WHERE id = ?", (job_id,))
+
+    def fetch_finished(self, limit: int = 20) -> list:
+        """Завершённые задачи, результат которых ещё не доставлен."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('done', 'failed') AND delivered = 0 "
+                "ORDER BY finished_at LIMIT ?",
+                (limit,)
+            ).fetchall()
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["result"] = json.loads(job["result"]) if job["result"] else None
+            jobs.append(job)
+        return jobs
+
+    def mark_delivered(self, job_id: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET delivered = 1 WHERE id = ?", (job_id,))
+
+    def stats(self) -> dict:
+        """Количество задач по статусам."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({r["status"]: r["n"] for r in rows})
+        return counts
+
+
+def broker_from_env() -> Optional[JobBroker]:
+    """Создаёт брокер, если задан JOB_BROKER_PATH; иначе — режим одного процесса."""
+    db_path = os.getenv("JOB_BROKER_PATH")
+    if not db_path:
+        return None
+    return JobBroker(
+        db_path,
+        lease_timeout=int(os.getenv("JOB_LEASE_TIMEOUT", "300")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    )
@@ -0,0 +1,553 @@
+"""Нагрузочный тест бота на локальной заглушке Telegram Bot API.
+
+Заглушка реализует методы, которые использует бот (getUpdates, getFile,
+скачивание файла, sendMessage и др.), и ограничивает частоту отправки
+как Telegram, отвечая 429. Бот направляется на неё через TELEGRAM_API_URL.
+
+Примеры:
+    # запустить бота самостоятельно и дать ему 10 пользователей по 3 сообщения
+    python load_test.py --spawn --users 10 --messages 3 --video-ratio 0.3
+
+    # бот уже запущен с TELEGRAM_API_URL=http://127.0.0.1:8081
+    python load_test.py --port 8081 --users 5
+
+Каждый пользователь отправляет следующее сообщение только после того,
+как получил результат предыдущего (замкнутая нагрузка).
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import queue
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+
+logger = logging.getLogger("load_test")
+
+BOT_TOKEN = "123456:LOADTEST"
+ADMIN_ID = 10_000_000
+FIRST_USER_ID = 10_000_001
+
+# Начала ответов бота, по которым определяются этапы обработки
+STARTED_PREFIX = "Обрабатываю ваш запрос"
+FINAL_PREFIXES = ("Сохранено как", "Ошибка", "Этот файл уже распознан",
+                  "Формат", "⛔")
+
+
+class RateLimiter:
+    """Ограничение частоты отправки сообщений, как у Telegram:
+    в среднем не чаще chat_rate в секунду в один чат (с короткими
+    всплесками до chat_burst сообщений подряд) и global_rate всего."""
+
+    def __init__(self, chat_rate: float, global_rate: float, chat_burst: int = 3):
+        self.chat_rate = chat_rate
+        self.global_rate = global_rate
+        self.chat_burst = max(1, chat_burst)
+        self._chat_tokens = {}
+        self._global = []
+        self._lock = threading.Lock()
+
+    def check(self, chat_id) -> int:
+        """0 — можно отправлять, иначе retry_after в секундах."""
+        now = time.time()
+        with self._lock:
+            self._global = [t for t in self._global if now - t < 1]
+            if self.global_rate and len(self._global) >= self.global_rate:
+                return 1
+            if self.chat_rate:
+                # Ведро токенов: chat_burst сообщений подряд, затем chat_rate в секунду
+                tokens, last = self._chat_tokens.get(chat_id, (self.chat_burst, now))
+                tokens = min(self.chat_burst, tokens + (now - last) * self.chat_rate)
+                if tokens < 1:
+                    self._chat_tokens[chat_id] = (tokens, now)
+                    return max(1, math.ceil((1 - tokens) / self.chat_rate))
+                self._chat_tokens[chat_id] = (tokens - 1, now)
+            self._global.append(now)
+            return 0
+
+
+class FakeTelegram:
+    """Состояние заглушки: очередь обновлений, файлы и отправленные сообщения."""
+
+    def __init__(self, limiter: RateLimiter):
+        self.limiter = limiter
+        self.updates = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.files = {}
+        self.fetched_at = {}
+        self.chat_events = {}
+        self.rate_limited = []
+        self.delivered = []
+        self.calls = {}
+        self._cond = threading.Condition()
+
+    # ── Действия пользователей
+
+    def add_file(self, file_id: str, file_path: str, data: bytes):
+        self.files[file_id] = (file_path, data)
+
+    def inject(self, user_id: int, kind: str, file_id: str, sample: dict) -> dict:
+        """Кладёт в getUpdates сообщение пользователя с голосовым или видео."""
+        with self._cond:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+            media = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(sample["data"]),
+                "duration": sample["duration"],
+            }
+            if kind == "video":
+                media.update({"width": 320, "height": 240,
+                              "file_name": f"video_{message_id}{sample['ext']}",
+                              "mime_type": "video/mp4"})
+            else:
+                media["mime_type"] = "audio/ogg"
+            user = {"id": user_id, "is_bot": False,
+                    "first_name": f"User{user_id}", "username": f"user{user_id}"}
+            message = {
+                "message_id": message_id,
+                "from": user,
+                "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+                "date": int(time.time()),
+                kind: media,
+            }
+            self.updates.append(
+                {"update_id": self.next_update_id, "message": message})
+            self.next_update_id += 1
+            self.chat_events.setdefault(user_id, queue.Queue())
+            self._cond.notify_all()
+        return {"message_id": message_id, "injected_at": time.time()}
+
+    # ── Методы Bot API
+
+    def get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0) or 0)
+        timeout = float(params.get("timeout", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        deadline = time.time() + timeout
+        with self._cond:
+            # offset подтверждает получение предыдущих обновлений
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            batch = self.updates[:limit]
+            now = time.time()
+            for update in batch:
+                self.fetched_at.setdefault(
+                    update["message"]["message_id"], now)
+            return batch
+
+    def send_message(self, params: dict):
+        chat_id = int(params["chat_id"])
+        text = params.get("text") or params.get("caption") or ""
+        retry_after = self.limiter.check(chat_id)
+        now = time.time()
+        if retry_after:
+            self.rate_limited.append(
+                {"time": now, "chat_id": chat_id, "text": text})
+            return None, retry_after
+
+        reply_to = params.get("reply_to_message_id")
+        if params.get("reply_parameters"):
+            reply_to = json.loads(params["reply_parameters"]).get("message_id")
+        with self._cond:
+            message_id = self.next_message_id
+            self.next_message_id += 1
+        self.delivered.append({"time": now, "chat_id": chat_id, "text": text})
+        if chat_id in self.chat_events:
+            self.chat_events[chat_id].put({
+                "time": now,
+                "text": text,
+                "reply_to": int(reply_to) if reply_to else None,
+            })
+        return {
+            "message_id": message_id,
+            "date": int(now),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "Bot"},
+            "text": text,
+        }, 0
+
+    def count_call(self, method: str):
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    telegram: FakeTelegram = None
+
+    def log_message(self, format, *args):
+        logger.debug("%s " + format, self.address_string(), *args)
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+
+        # /file/bot<token>/<file_path> — скачивание файла
+        if parts[0] == "file" and len(parts) >= 3:
+            self.telegram.count_call("downloadFile")
+            file_path = "/".join(parts[2:])
+            for path, data in self.telegram.files.values():
+                if path == file_path:
+                    self._send(200, data, "application/octet-stream")
+                    return
+            self._send_json(404, {"ok": False, "error_code": 404,
+                                  "description": "Not Found"})
+            return
+
+        if len(parts) != 2 or not parts[0].startswith("bot"):
+            self._send_json(404, {"ok": False, "error_code": 404,
+                                  "description": "Not Found"})
+            return
+
+        method = parts[1]
+        params = self._read_params(parsed.query)
+        self.telegram.count_call(method)
+
+        if method == "getUpdates":
+            self._ok(self.telegram.get_updates(params))
+        elif method == "getMe":
+            self._ok({"id": 1, "is_bot": True, "first_name": "LoadTestBot",
+                      "username": "load_test_bot"})
+        elif method == "getFile":
+            file_id = params.get("file_id")
+            if file_id not in self.telegram.files:
+                self._send_json(400, {"ok": False, "error_code": 400,
+                                      "description": "Bad Request: invalid file_id"})
+                return
+            file_path, data = self.telegram.files[file_id]
+            self._ok({"file_id": file_id, "file_unique_id": file_id,
+                      "file_size": len(data), "file_path": file_path})
+        elif method in ("sendMessage", "sendDocument"):
+            result, retry_after = self.telegram.send_message(params)
+            if retry_after:
+                self._send_json(429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                })
+            else:
+                self._ok(result)
+        else:
+            # deleteWebhook и прочие служебные вызовы
+            self._ok(True)
+
+    def _read_params(self, query: str) -> dict:
+        params = {k: v[0] for k, v in parse_qs(query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return params
+        body = self.rfile.read(length)
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            params.update(json.loads(body))
+        elif content_type.startswith("multipart/form-data"):
+            message = BytesParser(policy=HTTP).parsebytes(
+                b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body)
+            for part in message.iter_parts():
+                if not part.get_filename():
+                    params[part.get_param("name", header="content-disposition")] = \
+                        part.get_content()
+        else:
+            params.update({k: v[0] for k, v in parse_qs(
+                body.decode("utf-8")).items()})
+        return params
+
+    def _ok(self, result):
+        self._send_json(200, {"ok": True, "result": result})
+
+    def _send_json(self, code: int, payload: dict):
+        self._send(code, json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                   "application/json")
+
+    def _send(self, code: int, body: bytes, content_type: str):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# ── Тестовые файлы
+
+def make_voice_sample(path: Path, seconds: float = 3.0) -> Path:
+    """WAV 16 кГц моно с тоном — достаточно, чтобы пройти весь конвейер."""
+    rate = 16000
+    frames = bytearray()
+    for i in range(int(rate * seconds)):
+        value = int(8000 * math.sin(2 * math.pi * 440 * i / rate))
+        frames += value.to_bytes(2, "little", signed=True)
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(bytes(frames))
+    return path
+
+
+def make_video_sample(path: Path, seconds: float = 3.0):
+    """MP4 с тестовой картинкой и тоном через ffmpeg; None, если ffmpeg нет."""
+    if not shutil.which("ffmpeg"):
+        return None
+    subprocess.run(
+        ["ffmpeg", "-y",
+         "-f", "lavfi", "-i", f"testsrc=size=320x240:rate=15:duration={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-shortest", "-pix_fmt", "yuv420p", str(path)],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    return path
+
+
+def load_sample(path: Path, seconds: float) -> dict:
+    return {"data": path.read_bytes(), "ext": path.suffix.lower(),
+            "duration": int(seconds)}
+
+
+# ── Сценарий
+
+def simulate_user(telegram: FakeTelegram, user_id: int, args, samples: dict,
+                  rng_seed: int, results: list):
+    """Пользователь отправляет сообщения по одному и ждёт результата каждого."""
+    rng = random.Random(rng_seed)
+    events = telegram.chat_events.setdefault(user_id, queue.Queue())
+
+    for n in range(args.messages):
+        kind = "video" if samples.get("video") and rng.random() < args.video_ratio else "voice"
+        sample = samples[kind]
+        file_id = f"{kind}_{user_id}_{n}_{int(time.time() * 1000)}"
+        folder = "videos" if kind == "video" else "voice"
+        telegram.add_file(file_id, f"{folder}/{file_id}{sample['ext']}", sample["data"])
+
+        sent = telegram.inject(user_id, kind, file_id, sample)
+        record = {"user_id": user_id, "kind": kind, **sent,
+                  "first_reply_at": None, "started_at": None,
+                  "finished_at": None, "final_text": None}
+
+        deadline = sent["injected_at"] + args.timeout
+        while time.time() < deadline:
+            try:
+                event = events.get(timeout=max(0.1, deadline - time.time()))
+            except queue.Empty:
+                break
+            if record["first_reply_at"] is None:
+                record["first_reply_at"] = event["time"]
+            if event["text"].startswith(STARTED_PREFIX):
+                record["started_at"] = event["time"]
+            if event["text"].startswith(FINAL_PREFIXES):
+                record["finished_at"] = event["time"]
+                record["final_text"] = event["text"][:80]
+                break
+
+        record["fetched_at"] = telegram.fetched_at.get(sent["message_id"])
+        results.append(record)
+        if record["finished_at"] is None:
+            logger.warning("Пользователь %s: нет результата за %s сек.", user_id, args.timeout)
+        time.sleep(args.think_time)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(math.ceil(p / 100 * len(values))) - 1)], 3)
+
+    return {"count": len(values), "p50": pick(50), "p90": pick(90),
+            "p95": pick(95), "p99": pick(99), "max": round(values[-1], 3)}
+
+
+def build_report(telegram: FakeTelegram, results: list, wall: float) -> dict:
+    def diff(a, b):
+        return [r[b] - r[a] for r in results if r[a] is not None and r[b] is not None]
+
+    completed = [r for r in results if r["finished_at"] is not None]
+    errors = [r for r in completed if r["final_text"] and r["final_text"].startswith("Ошибка")]
+
+    # 429: было ли то же сообщение позже доставлено (бот повторил отправку)
+    retried = 0
+    for limited in telegram.rate_limited:
+        if any(d["chat_id"] == limited["chat_id"] and d["text"] == limited["text"]
+               and d["time"] > limited["time"] for d in telegram.delivered):
+            retried += 1
+
+    return {
+        "wall_seconds": round(wall, 1),
+        "messages": len(results),
+        "completed": len(completed),
+        "errors": len(errors),
+        "timed_out": len(results) - len(completed),
+        "throughput_per_minute": round(len(completed) / wall * 60, 2) if wall else 0,
+        "intake_latency": percentiles(diff("injected_at", "fetched_at")),
+        "time_to_first_reply": percentiles(diff("injected_at", "first_reply_at")),
+        "queue_wait": percentiles(diff("first_reply_at", "started_at")),
+        "completion_latency": percentiles(diff("injected_at", "finished_at")),
+        "rate_limited": {
+            "responses_429": len(telegram.rate_limited),
+            "retried_by_bot": retried,
+            "lost": len(telegram.rate_limited) - retried,
+        },
+        "api_calls": dict(telegram.calls),
+    }
+
+
+def print_report(report: dict):
+    print(f"\nСообщений: {report['messages']}, завершено: {report['completed']}, "
+          f"ошибок: {report['errors']}, без ответа: {report['timed_out']}")
+    print(f"Время теста: {report['wall_seconds']} сек., "
+          f"пропускная способность: {report['throughput_per_minute']} в мин.")
+    print(f"\n{'метрика, сек.':<22}{'n':>6}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name in ("intake_latency", "time_to_first_reply", "queue_wait", "completion_latency"):
+        stats = report[name]
+        if not stats["count"]:
+            print(f"{name:<22}{0:>6}")
+            continue
+        print(f"{name:<22}{stats['count']:>6}" + "".join(
+            f"{stats[p]:>9.2f}" for p in ("p50", "p90", "p95", "p99", "max")))
+    limited = report["rate_limited"]
+    print(f"\n429: {limited['responses_429']} ответов, повторено ботом: "
+          f"{limited['retried_by_bot']}, потеряно: {limited['lost']}")
+    print(f"Вызовы API: {report['api_calls']}")
+
+
+def spawn_bot(api_url: str, workdir: Path, users: list) -> subprocess.Popen:
+    """Запускает main.py, направленный на заглушку, с разрешёнными тестовыми пользователями."""
+    users_file = workdir / "allowed_users.json"
+    users_file.write_text(json.dumps(users))
+    env = dict(os.environ,
+               API_KEY=BOT_TOKEN,
+               ADMIN_ID=str(ADMIN_ID),
+               TELEGRAM_API_URL=api_url,
+               ALLOWED_USERS_FILE=str(users_file),
+               LOG_DIR=str(workdir / "logs"),
+               TRANSCRIPTS_DB_PATH=str(workdir / "transcripts.db"),
+               PYTHONUNBUFFERED="1")
+    log = open(workdir / "bot.log", "wb")
+    logger.info("Запуск бота, журнал: %s", workdir / "bot.log")
+    return subprocess.Popen([sys.executable, str(Path(__file__).with_name("main.py"))],
+                            cwd=str(Path(__file__).parent), env=env,
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Нагрузочный тест бота на заглушке Telegram Bot API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=5, help="одновременных пользователей")
+    parser.add_argument("--messages", type=int, default=3, help="сообщений на пользователя")
+    parser.add_argument("--video-ratio", type=float, default=0.2, help="доля видео")
+    parser.add_argument("--think-time", type=float, default=1.0,
+                        help="пауза пользователя между сообщениями, сек.")
+    parser.add_argument("--timeout", type=float, default=600,
+                        help="ожидание результата одного сообщения, сек.")
+    parser.add_argument("--voice-sample", type=Path, help="аудиофайл (.ogg, .wav ...)")
+    parser.add_argument("--video-sample", type=Path, help="видеофайл (.mp4 ...)")
+    parser.add_argument("--chat-rate", type=float, default=1.0,
+                        help="лимит сообщений в секунду в один чат (0 — без лимита)")
+    parser.add_argument("--chat-burst", type=int, default=3,
+                        help="сколько сообщений подряд можно отправить в чат сверх лимита")
+    parser.add_argument("--global-rate", type=float, default=30.0,
+                        help="общий лимит сообщений в секунду (0 — без лимита)")
+    parser.add_argument("--spawn", action="store_true", help="запустить main.py самостоятельно")
+    parser.add_argument("--json", type=Path, help="сохранить отчёт в JSON")
+    parser.add_argument("--max-p95-completion", type=float,
+                        help="код выхода 1, если p95 полного времени выше порога, сек.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO,
+                        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+
+    workdir = Path(tempfile.mkdtemp(prefix="load_test_"))
+    voice_path = args.voice_sample or make_voice_sample(workdir / "voice.wav")
+    samples = {"voice": load_sample(voice_path, 3)}
+    if args.video_ratio > 0:
+        video_path = args.video_sample or make_video_sample(workdir / "video.mp4")
+        if video_path:
+            samples["video"] = load_sample(video_path, 3)
+        else:
+            logger.warning("ffmpeg не найден и --video-sample не задан — только голосовые.")
+
+    telegram = FakeTelegram(RateLimiter(args.chat_rate, args.global_rate, args.chat_burst))
+    handler = type("BoundFakeTelegramHandler", (FakeTelegramHandler,), {"telegram": telegram})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://{args.host}:{args.port}"
+    logger.info("Заглушка Bot API: %s (TELEGRAM_API_URL для бота, токен любой)", api_url)
+
+    user_ids = [FIRST_USER_ID + i for i in range(args.users)]
+    bot_process = None
+    try:
+        if args.spawn:
+            bot_process = spawn_bot(api_url, workdir, user_ids)
+        else:
+            logger.info("Бот должен разрешать пользователей %s..%s", user_ids[0], user_ids[-1])
+
+        # Ждём, пока бот начнёт опрашивать getUpdates
+        while not telegram.calls.get("getUpdates"):
+            if bot_process and bot_process.poll() is not None:
+                logger.error("Бот завершился, см. %s", workdir / "bot.log")
+                return 2
+            time.sleep(0.5)
+
+        results = []
+        started = time.time()
+        threads = [
+            threading.Thread(target=simulate_user,
+                             args=(telegram, user_id, args, samples, user_id, results),
+                             daemon=True)
+            for user_id in user_ids
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.time() - started
+
+        report = build_report(telegram, results, wall)
+        print_report(report)
+        if args.json:
+            args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    finally:
+        # Бот с загруженной моделью не должен пережить тест, даже при ошибке или Ctrl-C
+        if bot_process and bot_process.poll() is None:
+            bot_process.terminate()
+            try:
+                bot_process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                bot_process.kill()
+        server.shutdown()
+
+    p95 = report["completion_latency"].get("p95")
+    if args.max_p95_completion and (p95 is None or p95 > args.max_p95_completion):
+        print(f"\np95 полного времени {p95} сек. выше порога {args.max_p95_completion} сек.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
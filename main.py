@@ -1,19 +1,26 @@
+import atexit
 import platform
-from logging.handlers import RotatingFileHandler
-import subprocess
 import logging
 import os
 from pathlib import Path
 import time
+import uuid
 
 from threading import Thread, Lock
 from queue import Queue
-from typing import Tuple
+from typing import Optional, Tuple
 
 import telebot
 from dotenv import load_dotenv
 
 from speech_recognizer_fast import SpeechRecognizerFast
+from job_broker import broker_from_env
+from http_api import ApiServer
+from model_governor import governor_from_env
+from transcript_store import store_from_env
+from profiler import SamplingProfiler
+from tracing import new_trace_id, record_span, setup_logging, span, trace_context
+from telebot import apihelper
 from telebot.apihelper import ApiTelegramException
 from queue import Queue
 import gc
@@ -22,49 +29,66 @@ from user_manager import UserManager
 from version import __version__, __release_date__
 
 
-LOG_DIR = "/app/logs"
-os.makedirs(LOG_DIR, exist_ok=True)
+# .env читается до настройки журнала: LOG_DIR тоже может быть задан там
+load_dotenv()
 
-handler = RotatingFileHandler(
-    os.path.join(LOG_DIR, "app.log"),
-    maxBytes=5_000_000,
-    backupCount=5
-)
+LOG_DIR = os.getenv("LOG_DIR", "/app/logs")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        handler,
-        logging.StreamHandler()
-    ]
-)
+# Журнал пишется через очередь в отдельном потоке: app.log с trace_id
+# задачи и traces.json со стадиями задач для Perfetto / chrome://tracing
+log_listener = setup_logging(LOG_DIR)
+# При выходе дописать записи, оставшиеся в очереди (в том числе стадии задач)
+atexit.register(log_listener.stop)
 
 logger = logging.getLogger("bot")
 
 # ────────────────────────────────
 # Настройка окружения
-load_dotenv()
 API_KEY = os.getenv("API_KEY")
 
 if not API_KEY:
     raise ValueError("Переменная API_KEY не найдена в .env")
 
+# Адрес Bot API можно подменить, например на локальную заглушку load_test.py
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL.rstrip("/") + "/bot{0}/{1}"
+    apihelper.FILE_URL = TELEGRAM_API_URL.rstrip("/") + "/file/bot{0}/{1}"
+
 bot = telebot.TeleBot(API_KEY)
 AUDIO_SAVE_PATH = Path("audio_files/input")
 AUDIO_SAVE_PATH.mkdir(parents=True, exist_ok=True)
 
 ADMIN_ID = int(os.getenv("ADMIN_ID"))  # замени на свой Telegram ID
-user_manager = UserManager(admin_id=ADMIN_ID)
+user_manager = UserManager(
+    file_path=os.getenv("ALLOWED_USERS_FILE", "allowed_users.json"),
+    admin_id=ADMIN_ID
+)
 
 recognizer = SpeechRecognizerFast()
 
+# Если задан JOB_BROKER_PATH — задачи уходят в общую очередь,
+# а распознаванием занимаются отдельные процессы worker.py
+broker = broker_from_env()
 
-# Очередь задач: (message, file_path)
+# Выгрузка модели по простою и по нехватке памяти; в режиме брокера
+# модель живёт в воркерах, и governor запускается там
+governor = None if broker else governor_from_env(SpeechRecognizerFast)
+
+# Архив расшифровок для /search и /get
+transcript_store = store_from_env()
+
+# Очередь задач: (job, file_path), job — TelegramJob или http_api.ApiJob
 task_queue = Queue()
 queue_lock = Lock()
 is_processing = False
 
+# Задачи HTTP API, отданные воркерам брокера: job_id → ApiJob
+remote_jobs = {}
+
+# Максимальная длительность /profile, сек.
+MAX_PROFILE_SECONDS = 300
+
 friendly_names = {
     "audio": "аудиофайл",
     "voice": "голосовое сообщение",
@@ -78,7 +102,7 @@ friendly_names = {
 
 @bot.message_handler(commands=["start", "help"])
 def send_welcome(message):
-    logger.info(f"Команда {message.text} от {message.chat.id}")
+    logger.info("Команда %s от %s", message.text, message.chat.id)
     bot.reply_to(message, "🎙 Отправь голосовое сообщение, и я его расшифрую!")
 
 
@@ -86,11 +110,135 @@ def send_welcome(message):
 def show_queue(message):
     if message.chat.id != ADMIN_ID:
         return
+    if broker:
+        stats = broker.stats()
+        bot.reply_to(
+            message,
+            f"Очередь: {stats['queued']} задач | В работе: {stats['running']} | "
+            f"Выполнено: {stats['done']} | Ошибок: {stats['failed']}")
+        return
     size = task_queue.qsize()
     status = "обрабатывается" if is_processing else "свободен"
     bot.reply_to(message, f"Очередь: {size} задач | Статус: {status}")
 
 
+@bot.message_handler(commands=["governor"])
+def show_governor(message):
+    if message.chat.id != ADMIN_ID:
+        return
+    if governor is None:
+        bot.reply_to(message, "Governor работает в процессах воркеров.")
+        return
+
+    state = governor.snapshot()
+    sample = state["last_sample"] or governor.sample()
+    lines = [
+        f"Модель: {'загружена' if sample['model_loaded'] else 'выгружена'} "
+        f"({sample['compute_type']}), задач: {sample['active_jobs']}",
+        f"RSS: {_format_bytes(sample['rss_bytes'])}",
+        f"Память ({sample['memory_scope']}): {_format_bytes(sample['memory_used_bytes'])} "
+        f"из {_format_bytes(sample['memory_limit_bytes'])}",
+    ]
+    if sample["gpu_total_bytes"]:
+        lines.append(
+            f"GPU: {_format_bytes(sample['gpu_used_bytes'])} из {_format_bytes(sample['gpu_total_bytes'])}")
+    for decision in state["decisions"][-5:]:
+        moment = time.strftime("%H:%M:%S", time.localtime(decision["time"]))
+        lines.append(f"{moment} {decision['action']}: {decision['reason']}")
+    bot.reply_to(message, "\n".join(lines))
+
+
+def _format_bytes(value) -> str:
+    if value is None:
+        return "—"
+    return f"{value / 1024 ** 3:.2f} ГБ"
+
+
+@bot.message_handler(commands=["profile"])
+def profile_command(message):
+    if message.chat.id != ADMIN_ID:
+        return
+
+    parts = message.text.split(maxsplit=1)
+    try:
+        seconds = int(parts[1]) if len(parts) > 1 else 30
+    except ValueError:
+        bot.reply_to(message, "Использование: /profile <секунды>")
+        return
+    seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+
+    note = " Распознавание идёт в процессах воркеров — здесь виден только бот." if broker else ""
+    bot.reply_to(message, f"⏱ Профилирую {seconds} сек.{note}")
+    # Не блокируем поток обработки сообщений на время замера
+    Thread(target=run_profile, args=(message.chat.id, seconds),
+           daemon=True, name="profiler").start()
+
+
+def run_profile(chat_id: int, seconds: int):
+    try:
+        profiler = SamplingProfiler().run(seconds)
+    except RuntimeError as e:
+        bot.send_message(chat_id, str(e))
+        return
+
+    path = profiler.save(Path(LOG_DIR) / "profiles")
+    summary = profiler.summary()
+    if len(summary) > 3500:
+        summary = summary[:3500] + "\n…"
+    bot.send_message(chat_id, summary)
+    with open(path, "rb") as f:
+        bot.send_document(
+            chat_id, f, caption="Стеки для flamegraph.pl / speedscope")
+    logger.info("Профиль сохранён: %s", path)
+
+
+@bot.message_handler(commands=["search"])
+def search_command(message):
+    if not user_manager.is_allowed(message.chat.id) and message.chat.id != ADMIN_ID:
+        return
+
+    parts = message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        bot.reply_to(message, "Использование: /search <слова>")
+        return
+
+    results = transcript_store.search(message.chat.id, parts[1])
+    if not results:
+        bot.reply_to(message, "🔍 Ничего не найдено.")
+        return
+
+    lines = []
+    for item in results:
+        created = time.strftime(
+            "%d.%m.%Y %H:%M", time.localtime(item["created_at"]))
+        lines.append(f"#{item['id']} · {created}\n{item['snippet']}")
+    lines.append("Полный текст: /get <id>")
+    bot.reply_to(message, "\n\n".join(lines))
+
+
+@bot.message_handler(commands=["get"])
+def get_transcript_command(message):
+    if not user_manager.is_allowed(message.chat.id) and message.chat.id != ADMIN_ID:
+        return
+
+    try:
+        _, transcript_id = message.text.split(maxsplit=1)
+        transcript_id = int(transcript_id.lstrip("#"))
+    except ValueError:
+        bot.reply_to(message, "Использование: /get <id>")
+        return
+
+    transcript = transcript_store.get(transcript_id, message.chat.id)
+    if transcript is None:
+        bot.reply_to(message, f"Расшифровка #{transcript_id} не найдена.")
+        return
+
+    created = time.strftime(
+        "%d.%m.%Y %H:%M", time.localtime(transcript["created_at"]))
+    bot.reply_to(message, f"📄 Расшифровка #{transcript_id} от {created}")
+    send_text_chunks(message.chat.id, transcript["text"])
+
+
 @bot.message_handler(commands=["adduser"])
 def add_user_command(message):
     if message.chat.id != user_manager.admin_id:
@@ -193,20 +341,27 @@ def start_bot():
 
             text = show_version_log()
 
-            logger.info(f"{text}")
+            logger.info(text)
 
             # bot.polling(none_stop=True)
             bot.polling(none_stop=True, interval=3, timeout=20)
         except ApiTelegramException as e:
-            logger.error(f"Ошибка Telegram API: {str(e)}")
+            logger.error("Ошибка Telegram API: %s", str(e))
             time.sleep(15)  # Ждём перед перезапуском
         except Exception as e:
-            logger.error(f"Общая ошибка: {str(e)}")
+            logger.error("Общая ошибка: %s", str(e))
             time.sleep(15)  # Ждём перед перезапуском
 
 
 @bot.message_handler(content_types=["audio", "voice", "video", "video_note"])
 def handle_audio(message):
+    # trace_id совпадает с id задачи и проходит через очередь, воркер и модель
+    job_id = new_trace_id()
+    with trace_context(job_id), span("handle_audio", chat_id=message.chat.id):
+        _handle_audio(message, job_id)
+
+
+def _handle_audio(message, job_id: str):
     try:
         user_id = message.chat.id
 
@@ -226,27 +381,31 @@ def handle_audio(message):
                     f"Добавить его можно командой:\n/adduser {user_id}"
                 )
             except Exception as e:
-                logger.error(f"Ошибка при уведомлении администратора: {e}")
+                logger.error("Ошибка при уведомлении администратора: %s", e)
                 return
 
             # Определяем тип файла и параметры
         if message.audio:
             file_id = message.audio.file_id
+            file_unique_id = message.audio.file_unique_id
             file_name = message.audio.file_name or f"audio_{message.message_id}"
             file_size = message.audio.file_size
             file_type = "audio"
         elif message.voice:
             file_id = message.voice.file_id
+            file_unique_id = message.voice.file_unique_id
             file_name = f"voice_{message.message_id}"
             file_size = message.voice.file_size
             file_type = "voice"
         elif message.video:
             file_id = message.video.file_id
+            file_unique_id = message.video.file_unique_id
             file_name = message.video.file_name or f"video_{message.message_id}"
             file_size = message.video.file_size
             file_type = "video"
         elif message.video_note:
             file_id = message.video_note.file_id
+            file_unique_id = message.video_note.file_unique_id
             file_name = f"video_note_{message.message_id}.mp4"
             file_size = message.video_note.file_size
             file_type = "video_note"
@@ -254,16 +413,25 @@ def handle_audio(message):
             bot.reply_to(message, "Неизвестный тип файла.")
             return
 
+        # Тот же файл уже распознавался — отдаём сохранённый текст без модели
+        cached = transcript_store.find_by_file(user_id, file_unique_id)
+        if cached:
+            bot.reply_to(
+                message, f"Этот файл уже распознан ранее (#{cached['id']}). Отправляю сохранённый текст.")
+            send_text_chunks(user_id, cached["text"])
+            return
+
         logger.info(
-            f"Получен файл: {file_name}, file_id: {file_id}, размер: {file_size} байт")
+            "Получен файл: %s, file_id: %s, размер: %s байт", file_name, file_id, file_size)
 
-        logger.info(f"Сообщение от {message.chat.id}")
+        logger.info("Сообщение от %s", message.chat.id)
 
         # file_info = bot.get_file(
         #     message.audio.file_id if message.audio else message.voice.file_id
         # )
 
-        file_info = bot.get_file(file_id)
+        with span("telegram.get_file"):
+            file_info = bot.get_file(file_id)
 
         original_extension = os.path.splitext(file_info.file_path)[1].lower()
 
@@ -290,18 +458,19 @@ def handle_audio(message):
 
         # Получаем file_path и скачиваем файл
         # file_info = bot.get_file(file_id)
-        file_path = AUDIO_SAVE_PATH / file_name
+        # id чата в имени: message_id уникален только внутри чата
+        file_path = AUDIO_SAVE_PATH / f"{message.chat.id}_{file_name}"
 
         print(file_path)
         print(file_name)
 
-        downloaded_file = bot.download_file(file_info.file_path)
-        file_path = AUDIO_SAVE_PATH / file_name
-        with open(file_path, "wb") as f:
-            f.write(downloaded_file)
+        with span("telegram.download", size=file_size):
+            downloaded_file = bot.download_file(file_info.file_path)
+            with open(file_path, "wb") as f:
+                f.write(downloaded_file)
 
         # Проверяем, есть ли уже кто-то в очереди
-        queue_size = task_queue.qsize()
+        queue_size = get_queue_size()
 
         friendly = friendly_names.get(file_type, "файл")
 
@@ -313,96 +482,264 @@ def handle_audio(message):
                 message, f"Получил {friendly}. В очереди {queue_size} запрос(ов). Ожидайте...")
 
         # Добавляем в очередь
-        task_queue.put((message, file_path))
+        job = TelegramJob(
+            message.chat.id,
+            reply_to=message.message_id,
+            job_id=job_id,
+            file_name=file_name,
+            file_unique_id=file_unique_id
+        )
+        submit_job(job, file_path, file_type=file_type)
 
     except Exception as e:
         logger.exception("Ошибка при приёме файла")
         bot.reply_to(message, f"Ошибка: {e}")
 
 
+class TelegramJob:
+    """Задача из Telegram: статус и результат отправляются в чат."""
+
+    source = "telegram"
+    on_segment = None
+
+    def __init__(
+        self,
+        chat_id: int,
+        reply_to: Optional[int] = None,
+        job_id: Optional[str] = None,
+        file_name: Optional[str] = None,
+        file_unique_id: Optional[str] = None
+    ):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.chat_id = chat_id
+        self.reply_to = reply_to
+        self.file_name = file_name
+        self.file_unique_id = file_unique_id
+
+    def started(self):
+        bot.send_message(self.chat_id, "Обрабатываю ваш запрос...")
+
+    def done(self, result: dict, duration: float):
+        with span("telegram.send_result", chars=len(result["text"])):
+            self._deliver(result, duration)
+
+    def _deliver(self, result: dict, duration: float):
+        transcript_id = None
+        try:
+            transcript_id = transcript_store.save(
+                self.chat_id,
+                result,
+                processing_time=duration,
+                file_name=self.file_name,
+                file_unique_id=self.file_unique_id
+            )
+        except Exception as e:
+            logger.error("Ошибка сохранения расшифровки: %s", e)
+
+        send_transcription(self.chat_id, result["text"], duration)
+        if transcript_id is not None:
+            bot.send_message(
+                self.chat_id, f"Сохранено как #{transcript_id}. Получить снова: /get {transcript_id}")
+
+    def failed(self, error: str):
+        bot.send_message(self.chat_id, f"Ошибка: {error}")
+
+
+def get_queue_size() -> int:
+    """Количество задач, ожидающих распознавания."""
+    if broker:
+        return broker.stats()["queued"]
+    return task_queue.qsize()
+
+
+def submit_job(job, file_path: Path, file_type: Optional[str] = None):
+    """Ставит задачу в локальную очередь или в брокер."""
+    job.enqueued_at = time.time()
+    if not broker:
+        task_queue.put((job, file_path))
+        return
+
+    if job.source != "telegram":
+        remote_jobs[job.job_id] = job
+    broker.submit(
+        file_path,
+        chat_id=job.chat_id,
+        reply_to=job.reply_to,
+        file_type=file_type,
+        source=job.source,
+        job_id=job.job_id,
+        file_unique_id=getattr(job, "file_unique_id", None)
+    )
+
+
+def get_status() -> dict:
+    """Состояние сервиса для проверок HTTP API."""
+    status = {
+        "version": __version__,
+        "mode": "broker" if broker else "local",
+        "queue_size": get_queue_size(),
+    }
+    if broker:
+        # Модель загружают воркеры; фронтенд готов, если брокер доступен
+        status["model_loaded"] = None
+        status["ready"] = True
+    else:
+        status["processing"] = is_processing
+        status["model_loaded"] = recognizer.is_model_loaded()
+        status["model_error"] = recognizer.model_load_error()
+        # Выгруженная по простою модель загрузится с первой задачей,
+        # поэтому готовность от неё не зависит
+        status["ready"] = worker_thread.is_alive() and status["model_error"] is None
+        status["governor"] = governor.snapshot()
+    return status
+
+
 def transcription_worker():
-    global is_processing
     while True:
-        message, file_path = task_queue.get()
-        if message is None:  # сигнал остановки
+        job, file_path = task_queue.get()
+        if job is None:  # сигнал остановки
             break
 
+        # Ошибка одной задачи (например, 429 при отправке ответа)
+        # не должна останавливать поток: иначе очередь встанет навсегда
         try:
-            with queue_lock:
-                is_processing = True
-
-            bot.send_message(message.chat.id, "Обрабатываю ваш запрос...")
-
-            start_time = time.time()
-
-            # Если это видео — сначала извлекаем аудио
-            if file_path.suffix.lower() in [".mp4", ".mov", ".mkv"]:
-                audio_path = extract_audio_from_video(file_path)
-                if not audio_path or not audio_path.exists():
-                    bot.send_message(
-                        message.chat.id, "Ошибка при извлечении аудио из видео.")
-                    continue
-                text = recognizer.transcribe_audio(str(audio_path))
-                try:
-                    audio_path.unlink()
-                except:
-                    pass
-            else:
-                text = recognizer.transcribe_audio(str(file_path))
-
-            duration = time.time() - start_time
-            duration_text = f"Время распознавания: {duration:.2f} сек."
-
-            bot.send_message(message.chat.id, duration_text)
-
-            MAX_LEN = 4000
-            chunks = split_text_by_chars(text, MAX_LEN)
-            for chunk in chunks:
-                bot.send_message(
-                    message.chat.id, f"Распознанный текст:\n{chunk}")
+            with trace_context(job.job_id):
+                process_job(job, file_path)
+        except Exception:
+            logger.exception("Необработанная ошибка задачи %s", job.job_id)
 
-        except Exception as e:
-            bot.send_message(message.chat.id, f"Ошибка: {e}")
-            logger.exception("Ошибка в воркере")
-        finally:
-            try:
-                file_path.unlink()
-            except:
-                pass
-            with queue_lock:
-                is_processing = False
-            task_queue.task_done()
 
-
-def extract_audio_from_video(video_path: Path) -> Path:
-    """Извлекает аудио из видеофайла с помощью ffmpeg и возвращает путь к .wav."""
-    audio_path = video_path.with_suffix(".wav")
+def process_job(job, file_path: Path):
+    global is_processing
+    record_span("queue_wait", job.enqueued_at, time.time())
     try:
-        subprocess.run(
-            [
-                "ffmpeg",
-                "-y",  # перезаписывать без запроса
-                "-i", str(video_path),
-                "-vn",  # без видео
-                "-acodec", "pcm_s16le",  # несжатый WAV
-                "-ar", "16000",  # частота дискретизации
-                "-ac", "1",  # моно
-                str(audio_path)
-            ],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+        with queue_lock:
+            is_processing = True
+
+        job.started()
+
+        start_time = time.time()
+
+        # Видео обрабатывается внутри: сначала извлекается аудио
+        with span("transcribe", source=job.source):
+            result = recognizer.transcribe(
+                file_path, on_segment=job.on_segment)
+
+        duration = time.time() - start_time
+        job.done(result, duration)
+
+    except Exception as e:
+        logger.exception("Ошибка в воркере")
+        try:
+            job.failed(str(e))
+        except Exception:
+            logger.exception("Не удалось сообщить об ошибке задачи %s", job.job_id)
+    finally:
+        try:
+            file_path.unlink()
+        except:
+            pass
+        with queue_lock:
+            is_processing = False
+        task_queue.task_done()
+
+
+def send_transcription(chat_id: int, text: str, duration: float):
+    """Отправляет пользователю время распознавания и текст частями."""
+    duration_text = f"Время распознавания: {duration:.2f} сек."
+
+    bot.send_message(chat_id, duration_text)
+
+    send_text_chunks(chat_id, text)
+
+
+def send_text_chunks(chat_id: int, text: str):
+    """Отправляет текст частями по 4000 символов."""
+    MAX_LEN = 4000
+    chunks = split_text_by_chars(text, MAX_LEN)
+    for chunk in chunks:
+        bot.send_message(
+            chat_id, f"Распознанный текст:\n{chunk}")
+
+
+def _broker_job(row: dict):
+    """Находит получателя результата задачи брокера."""
+    if row["source"] == "telegram":
+        return TelegramJob(
+            row["chat_id"],
+            reply_to=row["reply_to"],
+            job_id=row["id"],
+            file_name=Path(row["file_path"]).name,
+            file_unique_id=row["file_unique_id"]
         )
-        return audio_path
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Ошибка при извлечении аудио из видео: {e}")
-        return None
+    # Задачи API после перезапуска бота доставить уже некому
+    return remote_jobs.get(row["id"])
+
+
+def result_dispatcher():
+    """Режим брокера: сообщает пользователям о статусе задач и отправляет результаты."""
+    while True:
+        try:
+            for row in broker.fetch_started():
+                job = _broker_job(row)
+                with trace_context(row["id"]):
+                    try:
+                        if job:
+                            job.started()
+                    except Exception as e:
+                        logger.error(
+                            "Ошибка отправки статуса задачи %s: %s", row["id"], e)
+                broker.mark_start_notified(row["id"])
+
+            for row in broker.fetch_finished():
+                job = _broker_job(row)
+                remote_jobs.pop(row["id"], None)
+                with trace_context(row["id"]):
+                    try:
+                        if job is not None and row["status"] == "done":
+                            result = row["result"]
+                            job.done(result, result["duration"])
+                        elif job is not None:
+                            job.failed(row["error"])
+                    except Exception:
+                        logger.exception(
+                            "Ошибка доставки результата задачи %s", row["id"])
+                broker.mark_delivered(row["id"])
+                # Файл мог остаться, если все попытки воркеров исчерпаны
+                Path(row["file_path"]).unlink(missing_ok=True)
+        except Exception as e:
+            logger.error("Ошибка брокера: %s", e)
+        time.sleep(1)
 
 
 # Запускаем при старте
-worker_thread = Thread(target=transcription_worker, daemon=True)
+if governor:
+    governor.start()
+if broker:
+    worker_thread = Thread(target=result_dispatcher,
+                           daemon=True, name="result-dispatcher")
+else:
+    worker_thread = Thread(target=transcription_worker,
+                           daemon=True, name="transcription-worker")
 worker_thread.start()
 
+# HTTP API работает в этом же процессе: общая очередь и одна копия модели
+HTTP_API_PORT = os.getenv("HTTP_API_PORT")
+if HTTP_API_PORT:
+    api_server = ApiServer(
+        submit_job=submit_job,
+        queue_size=get_queue_size,
+        get_status=get_status,
+        host=os.getenv("HTTP_API_HOST", "127.0.0.1"),
+        port=int(HTTP_API_PORT),
+        token=os.getenv("HTTP_API_TOKEN")
+    )
+    api_server.start()
+    if not broker:
+        # Прогреваем модель, чтобы первый запрос не ждал загрузки
+        # (и /readyz сразу показал ошибку загрузки, если она есть)
+        Thread(target=recognizer.warmup, daemon=True).start()
+
 
 if __name__ == "__main__":
     start_bot()
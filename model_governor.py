@@ -0,0 +1,323 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+import torch
+
+try:
+    import pynvml
+    HAS_NVML = True
+except ImportError:
+    HAS_NVML = False
+
+
+logger = logging.getLogger(__name__)
+
+# Лимит cgroup v1 без ограничения — очень большое число
+_CGROUP_V1_UNLIMITED = 1 << 60
+
+# Как часто повторять загрузку модели после ошибки, сек.
+LOAD_RETRY_INTERVAL = 60
+
+
+def _read_int(path: Path) -> Optional[int]:
+    try:
+        value = path.read_text().strip()
+    except (OSError, ValueError):
+        return None
+    if not value or value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def read_process_rss() -> Optional[int]:
+    """Резидентная память процесса в байтах (Linux, /proc)."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def read_cgroup_memory() -> tuple:
+    """(использовано, лимит) памяти контейнера в байтах; лимит None — без ограничения."""
+    # cgroup v2
+    root = Path("/sys/fs/cgroup")
+    if (root / "memory.current").exists():
+        return _read_int(root / "memory.current"), _read_int(root / "memory.max")
+
+    # cgroup v1
+    v1 = root / "memory"
+    usage = _read_int(v1 / "memory.usage_in_bytes")
+    limit = _read_int(v1 / "memory.limit_in_bytes")
+    if limit is not None and limit >= _CGROUP_V1_UNLIMITED:
+        limit = None
+    return usage, limit
+
+
+def read_host_memory() -> tuple:
+    """(использовано, всего) памяти хоста в байтах по /proc/meminfo."""
+    values = {}
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                key, rest = line.split(":", 1)
+                values[key] = int(rest.split()[0]) * 1024
+    except (OSError, ValueError):
+        return None, None
+    total = values.get("MemTotal")
+    available = values.get("MemAvailable")
+    if total is None or available is None:
+        return None, None
+    return total - available, total
+
+
+def read_gpu_memory() -> tuple:
+    """(занято, всего) памяти GPU в байтах. Учитывает и ctranslate2, не только torch.
+
+    Контекст CUDA в torch не создаётся: он сам занимает сотни МБ видеопамяти
+    в процессе, где модель работает через ctranslate2. Если torch ещё не
+    инициализировал CUDA, память читается через NVML (пакет nvidia-ml-py).
+    """
+    if torch.cuda.is_initialized():
+        try:
+            free, total = torch.cuda.mem_get_info()
+        except Exception:
+            return None, None
+        return total - free, total
+    if HAS_NVML:
+        return _read_nvml_memory()
+    return None, None
+
+
+def _read_nvml_memory() -> tuple:
+    # NVML нумерует все GPU хоста; берём первое устройство из CUDA_VISIBLE_DEVICES
+    visible = os.getenv("CUDA_VISIBLE_DEVICES", "0").split(",")[0].strip()
+    try:
+        pynvml.nvmlInit()
+        if visible.isdigit():
+            handle = pynvml.nvmlDeviceGetHandleByIndex(int(visible))
+        else:
+            handle = pynvml.nvmlDeviceGetHandleByUUID(visible)
+        info = pynvml.nvmlDeviceGetMemoryInfo(handle)
+    except Exception:
+        return None, None
+    return info.used, info.total
+
+
+class ModelGovernor:
+    """Решает, когда выгружать модель или понижать её точность.
+
+    Раз в interval секунд снимает показатели памяти (RSS процесса, память
+    и лимит cgroup либо хоста, память GPU). Модель освобождается, если
+    использование выше high_watermark или модель простаивает дольше
+    idle_timeout. Пока есть активные задачи, модель не трогается.
+    При нехватке памяти сначала пробуется облегчённый compute_type
+    (если downgrade=True), затем полная выгрузка. Исходная точность
+    возвращается при следующей выгрузке, если модель с облегчённой
+    точностью была загружена и память держалась ниже low_watermark
+    не меньше restore_after секунд. Замеры без загруженной модели для
+    этого не годятся: в них нет памяти самой модели.
+
+    Если последняя загрузка модели не удалась, governor повторяет её
+    не чаще раза в LOAD_RETRY_INTERVAL секунд.
+
+    Последний замер и журнал решений доступны через snapshot().
+    """
+
+    def __init__(
+        self,
+        recognizer,
+        idle_timeout: float = 600,
+        high_watermark: float = 0.90,
+        low_watermark: float = 0.75,
+        gpu_high_watermark: float = 0.95,
+        interval: float = 15,
+        downgrade: bool = True,
+        restore_after: float = 600
+    ):
+        self.recognizer = recognizer
+        self.idle_timeout = idle_timeout
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.gpu_high_watermark = gpu_high_watermark
+        self.interval = interval
+        self.downgrade = downgrade
+        self.restore_after = restore_after
+
+        # С какого момента загруженная облегчённая модель не создаёт давления
+        self._calm_since = None
+        self._last_load_retry = 0.0
+        self.last_sample = None
+        self.decisions = deque(maxlen=50)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="model-governor", daemon=True)
+        self._thread.start()
+        logger.info(
+            "Governor запущен: простой %s сек., порог памяти %.0f%%, GPU %.0f%%",
+            self.idle_timeout, self.high_watermark * 100, self.gpu_high_watermark * 100)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Ошибка в governor")
+
+    def sample(self) -> dict:
+        """Снимает текущие показатели памяти."""
+        active, last_use = self.recognizer.get_activity()
+        rss = read_process_rss()
+        cgroup_used, cgroup_limit = read_cgroup_memory()
+        if cgroup_limit:
+            memory_used, memory_total, memory_scope = cgroup_used, cgroup_limit, "cgroup"
+        else:
+            memory_used, memory_total = read_host_memory()
+            memory_scope = "host"
+        gpu_used, gpu_total = read_gpu_memory()
+
+        return {
+            "time": time.time(),
+            "model_loaded": self.recognizer.is_model_loaded(),
+            "compute_type": self.recognizer._model_manager.compute_type,
+            "active_jobs": active,
+            "idle_seconds": round(time.time() - last_use, 1) if last_use else None,
+            "rss_bytes": rss,
+            "memory_scope": memory_scope,
+            "memory_used_bytes": memory_used,
+            "memory_limit_bytes": memory_total,
+            "memory_ratio": _ratio(memory_used, memory_total),
+            "gpu_used_bytes": gpu_used,
+            "gpu_total_bytes": gpu_total,
+            "gpu_ratio": _ratio(gpu_used, gpu_total),
+        }
+
+    def tick(self) -> Optional[dict]:
+        """Один цикл: замер и, при необходимости, действие над моделью."""
+        sample = self.sample()
+        self.last_sample = sample
+
+        memory_ratio = sample["memory_ratio"] or 0.0
+        gpu_ratio = sample["gpu_ratio"] or 0.0
+        over_memory = memory_ratio >= self.high_watermark
+        over_gpu = gpu_ratio >= self.gpu_high_watermark
+        idle = sample["idle_seconds"]
+        manager = self.recognizer._model_manager
+        downgraded = manager.compute_type != manager.base_compute_type
+
+        if not sample["model_loaded"]:
+            # Загрузка не удалась (например, сеть при скачивании модели) —
+            # повторяем в фоне, иначе сервис так и останется неготовым
+            if (self.recognizer.model_load_error() and not over_memory
+                    and sample["time"] - self._last_load_retry >= LOAD_RETRY_INTERVAL):
+                self._last_load_retry = sample["time"]
+                self.recognizer.warmup()
+                error = self.recognizer.model_load_error()
+                return self._record(
+                    "load" if error is None else "load_failed",
+                    "повтор после ошибки загрузки", sample)
+
+            # Облегчённая модель долго работала без давления —
+            # следующая загрузка пойдёт с исходной точностью
+            if (downgraded and self._calm_since is not None
+                    and sample["time"] - self._calm_since >= self.restore_after
+                    and self.recognizer.restore_compute_type()):
+                self._calm_since = None
+                return self._record(
+                    "restore", f"память ниже нижнего порога {self.restore_after:.0f} сек.", sample)
+            return None
+
+        if (downgraded and memory_ratio < self.low_watermark
+                and gpu_ratio < self.low_watermark):
+            if self._calm_since is None:
+                self._calm_since = sample["time"]
+        else:
+            self._calm_since = None
+
+        if over_memory or over_gpu:
+            reason = (f"память {memory_ratio:.0%} ≥ {self.high_watermark:.0%}" if over_memory
+                      else f"GPU {gpu_ratio:.0%} ≥ {self.gpu_high_watermark:.0%}")
+            downgrade = self.downgrade
+        elif idle is not None and idle >= self.idle_timeout:
+            reason = f"простой {idle:.0f} сек. ≥ {self.idle_timeout:.0f} сек."
+            downgrade = False
+        else:
+            return None
+
+        if sample["active_jobs"] > 0:
+            return self._record("skip", f"{reason}, но есть активные задачи", sample)
+
+        action = self.recognizer.release_model(downgrade=downgrade)
+        if action is None:
+            return self._record("skip", f"{reason}, но модель занята", sample)
+        if action == "downgrade":
+            self._calm_since = None
+        return self._record(action, reason, sample)
+
+    def _record(self, action: str, reason: str, sample: dict) -> dict:
+        decision = {"time": sample["time"], "action": action,
+                    "reason": reason, "sample": sample}
+        # Повторяющиеся «skip» не засоряют журнал
+        if not (action == "skip" and self.decisions
+                and self.decisions[-1]["action"] == "skip"
+                and self.decisions[-1]["reason"] == reason):
+            self.decisions.append(decision)
+            level = logging.DEBUG if action == "skip" else logging.WARNING
+            logger.log(level, "Governor: %s — %s", action, reason)
+        return decision
+
+    def snapshot(self) -> dict:
+        """Состояние для мониторинга: настройки, последний замер, последние решения."""
+        return {
+            "idle_timeout": self.idle_timeout,
+            "high_watermark": self.high_watermark,
+            "low_watermark": self.low_watermark,
+            "gpu_high_watermark": self.gpu_high_watermark,
+            "restore_after": self.restore_after,
+            "calm_since": self._calm_since,
+            "last_sample": self.last_sample,
+            "decisions": [
+                {k: v for k, v in d.items() if k != "sample"}
+                for d in list(self.decisions)[-10:]
+            ],
+        }
+
+
+def _ratio(used: Optional[int], total: Optional[int]) -> Optional[float]:
+    if not used or not total:
+        return None
+    return round(used / total, 3)
+
+
+def governor_from_env(recognizer) -> ModelGovernor:
+    """Создаёт governor с настройками из переменных окружения."""
+    return ModelGovernor(
+        recognizer,
+        idle_timeout=float(os.getenv("MODEL_IDLE_TIMEOUT", "600")),
+        high_watermark=float(os.getenv("MODEL_MEMORY_HIGH_WATERMARK", "0.90")),
+        low_watermark=float(os.getenv("MODEL_MEMORY_LOW_WATERMARK", "0.75")),
+        gpu_high_watermark=float(os.getenv("MODEL_GPU_HIGH_WATERMARK", "0.95")),
+        interval=float(os.getenv("MODEL_GOVERNOR_INTERVAL", "15")),
+        downgrade=os.getenv("MODEL_ALLOW_DOWNGRADE", "1") == "1",
+        restore_after=float(os.getenv("MODEL_RESTORE_AFTER", "600")),
+    )
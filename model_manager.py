@@ -6,28 +6,47 @@ from typing import Optional
 from faster_whisper import WhisperModel
 import torch
 import uuid
+import threading
+
+from tracing import span
 
 
 logger = logging.getLogger(__name__)
 
+# Облегчённый compute_type, на который можно переключиться при нехватке памяти
+DOWNGRADE_COMPUTE_TYPES = {
+    "float32": "int8",
+    "float16": "int8_float16",
+    "bfloat16": "int8_bfloat16",
+    "int8_float32": "int8",
+}
+
 
 class WhisperModelManager:
     """Управление загрузкой и кэшированием модели faster-whisper."""
 
     _instance: Optional["WhisperModelManager"] = None
     _model: Optional[WhisperModel] = None
+    _load_lock = threading.Lock()
+    # Текст ошибки последней неудачной загрузки; None — модель загружается
+    load_error: Optional[str] = None
 
     def __init__(
         self,
         device: str = "cuda",
         compute_type: str = "float16",
         model_name: str = "Systran/faster-whisper-large-v2",
-        download_root: Optional[str] = None
-
-
+        download_root: Optional[str] = None,
+        cpu_threads: int = 0,
+        num_workers: int = 1
     ):
         self.device = device
         self.compute_type = compute_type
+        self.base_compute_type = compute_type
+        # cpu_threads=0 — значение ctranslate2 по умолчанию;
+        # num_workers > 1 — параллельные transcribe() из нескольких потоков
+        self.cpu_threads = cpu_threads
+        self.num_workers = num_workers
         self.model_name = model_name
         self.download_root = download_root or os.path.join(
             os.getcwd(), "app", "models", "faster-whisper-large-v2")
@@ -37,7 +56,7 @@ class WhisperModelManager:
         self.pid = os.getpid()
         self.uid = str(uuid.uuid4())[:8]
         logger.info(
-            f"[PID {self.pid}] WhisperModelManager создан, uid={self.uid}")
+            "[PID %s] WhisperModelManager создан, uid=%s", self.pid, self.uid)
 
     def __new__(cls, *args, **kwargs):
         """Синглтон: только один экземпляр менеджера."""
@@ -50,11 +69,25 @@ class WhisperModelManager:
         if self._model is not None:
             return self._model
 
-        logger.info(f"Загрузка модели faster-whisper на {self.device}...")
-        self._model = self._load_model()
+        # Модель могут запросить одновременно воркер и прогрев HTTP API
+        with self._load_lock:
+            if self._model is not None:
+                return self._model
+            logger.info("Загрузка модели faster-whisper на %s...", self.device)
+            try:
+                with span("model.load", device=self.device, compute_type=self.compute_type):
+                    model = self._model = self._load_model()
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self.load_error = None
         logger.info(
-            f"[PID {os.getpid()}] get_model → _model={'exists' if self._model else 'None'}")
-        return self._model
+            "[PID %s] get_model → _model=%s", os.getpid(), 'exists' if model else 'None')
+        return model
+
+    def is_loaded(self) -> bool:
+        """Загружена ли модель (без запуска загрузки)."""
+        return self._model is not None
 
     def _load_model(self) -> WhisperModel:
         """Пытается загрузить локально → иначе скачивает с HF."""
@@ -84,13 +117,15 @@ class WhisperModelManager:
                 model_size_or_path=self.model_name,
                 device=self.device,
                 compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+                num_workers=self.num_workers,
                 download_root=str(model_dir),
                 local_files_only=False,
             )
             logger.info("Модель успешно загружена с Hugging Face.")
             return model
         except Exception as e:
-            logger.error(f"Ошибка загрузки с Hugging Face: {e}")
+            logger.error("Ошибка загрузки с Hugging Face: %s", e)
             raise RuntimeError(
                 "Не удалось загрузить модель faster-whisper.") from e
 
@@ -99,9 +134,9 @@ class WhisperModelManager:
             return False
         missing = [f for f in self.required_files if not (path / f).is_file()]
         if missing:
-            logger.info(f"Отсутствуют файлы в {path}: {missing}")
+            logger.info("Отсутствуют файлы в %s: %s", path, missing)
             return False
-        logger.info(f"Валидная модель найдена: {path}")
+        logger.info("Валидная модель найдена: %s", path)
         return True
 
     def _find_latest_snapshot(self, hf_cache_dir: Path) -> Optional[Path]:
@@ -117,7 +152,7 @@ class WhisperModelManager:
         candidate = latest
         if self._is_valid_model_dir(candidate):
             return candidate
-        logger.warning(f"Последний snapshot повреждён: {candidate}")
+        logger.warning("Последний snapshot повреждён: %s", candidate)
         return None
 
     def _load_from_path(self, path: Path) -> WhisperModel:
@@ -126,24 +161,66 @@ class WhisperModelManager:
                 model_size_or_path=str(path),
                 device=self.device,
                 compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+                num_workers=self.num_workers,
                 local_files_only=True
             )
-            logger.info(f"Модель загружена локально из: {path}")
+            logger.info("Модель загружена локально из: %s", path)
             return model
         except Exception as e:
-            logger.error(f"Ошибка загрузки из {path}: {e}")
+            logger.error("Ошибка загрузки из %s: %s", path, e)
             raise
 
 
+    def downgrade(self) -> bool:
+        """Выгружает модель и переключает её на облегчённый compute_type.
+
+        Новая точность применится при следующей загрузке. False — понижать некуда.
+        """
+        # Под замком загрузки: get_model() не загрузит модель между
+        # выгрузкой и сменой точности
+        with self._load_lock:
+            lighter = DOWNGRADE_COMPUTE_TYPES.get(self.compute_type)
+            if lighter is None:
+                return False
+            self._drop_model()
+            logger.warning(
+                "compute_type понижен: %s → %s", self.compute_type, lighter)
+            self.compute_type = lighter
+        self._release_memory()
+        return True
+
+    def restore(self) -> bool:
+        """Возвращает исходный compute_type, если модель сейчас не загружена."""
+        with self._load_lock:
+            if self.compute_type == self.base_compute_type or self._model is not None:
+                return False
+            logger.info(
+                "compute_type восстановлен: %s → %s", self.compute_type, self.base_compute_type)
+            self.compute_type = self.base_compute_type
+            return True
+
     def cleanup(self):
         """Очистка модели и GPU (по желанию)."""
-        logger.info(f"Before cleanup: object={self._model}")
+        logger.info("Before cleanup: object=%s", self._model)
+
+        with self._load_lock:
+            self._drop_model()
+        self._release_memory()
+
+        logger.info("Модель выгружена из памяти.")
+        logger.info("After cleanup: object=%s", self._model)
 
+    def _drop_model(self):
+        """Удаляет ссылку на модель; вызывается под _load_lock."""
         if self._model is not None:
             del self._model
             self._model = None
             gc.collect()
-        if torch.cuda.is_available():
+
+    def _release_memory(self):
+        # Кэш torch есть, только если torch сам уже работал с CUDA
+        if torch.cuda.is_initialized():
             torch.cuda.empty_cache()
 
         # принудительно отдать память ОС
@@ -153,8 +230,4 @@ class WhisperModelManager:
             libc.malloc_trim(0)
             logger.info("malloc_trim(0) выполнен — память возвращена ОС.")
         except Exception as e:
-            logger.warning(f"malloc_trim недоступен: {e}")
-
-        logger.info("Модель выгружена из памяти.")
-        logger.info(f"After cleanup: object={self._model}")
-
+            logger.warning("malloc_trim недоступен: %s", e)
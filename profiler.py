@@ -0,0 +1,145 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# Листовые функции потоков, которые просто ждут работу; в сводку не попадают.
+# Ожидание в C (чтение сокета, time.sleep) видно как время вызывающей
+# Python-функции, поэтому здесь же чтение сокетов (long polling Telegram
+# ждёт до 20 сек.) и циклы, которые спят между опросами
+IDLE_FUNCTIONS = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("socketserver.py", "serve_forever"),
+    ("socket.py", "readinto"),
+    ("socket.py", "accept"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("ssl.py", "do_handshake"),
+    # time.sleep между опросами брокера и перезапусками polling
+    ("main.py", "result_dispatcher"),
+    ("main.py", "start_bot"),
+    ("worker.py", "run_worker"),
+}
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик всех потоков процесса.
+
+    Раз в interval секунд снимает стеки через sys._current_frames() из
+    отдельного потока, поэтому профилируемый код не меняется, а без
+    запущенного профилирования накладных расходов нет совсем. Время в
+    C-расширениях (ctranslate2, ffmpeg через subprocess, сокеты) видно
+    как время вызывающей Python-функции.
+    """
+
+    # Одновременно в процессе идёт не больше одного профилирования
+    _running = threading.Lock()
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    def run(self, seconds: float) -> "SamplingProfiler":
+        """Снимает стеки в течение seconds секунд (блокирует вызывающий поток)."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("Профилирование уже запущено.")
+        try:
+            own = threading.get_ident()
+            started = time.perf_counter()
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = _frame_stack(frame)
+                    thread = names.get(ident, str(ident))
+                    self.stacks[(thread,) + stack] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+            self.duration = time.perf_counter() - started
+        finally:
+            self._running.release()
+        return self
+
+    def busy_stacks(self) -> Counter:
+        """Стеки без ожидающих потоков."""
+        return Counter({
+            stack: count for stack, count in self.stacks.items()
+            if (stack[-1][0], stack[-1][1].rsplit(".", 1)[-1]) not in IDLE_FUNCTIONS
+        })
+
+    def collapsed(self) -> str:
+        """Стеки в формате collapsed/folded (flamegraph.pl, speedscope, inferno)."""
+        lines = []
+        for stack, count in sorted(self.stacks.items()):
+            thread, frames = stack[0], stack[1:]
+            names = [thread.replace(";", ":")] + [_label(f) for f in frames]
+            lines.append(f"{';'.join(names)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, top: int = 15) -> str:
+        """Топ функций по собственному и полному времени среди занятых потоков."""
+        busy = self.busy_stacks()
+        total = sum(busy.values())
+        lines = [f"Длительность {self.duration:.1f} сек., замеров {self.samples}, "
+                 f"активных стеков {total}"]
+        if not total:
+            lines.append("Потоки всё время простаивали.")
+            return "\n".join(lines)
+
+        threads = Counter()
+        own = Counter()
+        cumulative = Counter()
+        for stack, count in busy.items():
+            threads[stack[0]] += count
+            own[stack[-1]] += count
+            # Рекурсивная функция учитывается в стеке один раз;
+            # служебные кадры запуска потока есть в каждом стеке
+            for frame in set(stack[1:]):
+                if frame[0] != "threading.py":
+                    cumulative[frame] += count
+
+        lines.append("\nПотоки:")
+        for thread, count in threads.most_common(5):
+            lines.append(f"{count / total:6.1%}  {thread}")
+        lines.append("\nСобственное время:")
+        for frame, count in own.most_common(top):
+            lines.append(f"{count / total:6.1%}  {_label(frame)}")
+        lines.append("\nПолное время:")
+        for frame, count in cumulative.most_common(top):
+            lines.append(f"{count / total:6.1%}  {_label(frame)}")
+        return "\n".join(lines)
+
+    def save(self, directory: Path, prefix: str = "profile") -> Path:
+        """Сохраняет стеки в .folded-файл и возвращает путь к нему."""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.folded"
+        path.write_text(self.collapsed(), encoding="utf-8")
+        return path
+
+
+def _frame_stack(frame) -> tuple:
+    """Стек от корня к листу: (файл, функция, строка начала функции)."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        stack.append((os.path.basename(code.co_filename),
+                     name, code.co_firstlineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _label(frame: tuple) -> str:
+    file_name, name, line = frame
+    return f"{name} ({file_name}:{line})"
+
@@ -1,14 +1,16 @@
-import gc
 import time
 import logging
+import subprocess
+import uuid
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 import threading
 
-import torch
+import ctranslate2
 from pydub import AudioSegment, effects
 import mimetypes
 from model_manager import WhisperModelManager
+from tracing import span
 
 
 try:
@@ -22,6 +24,8 @@ logger = logging.getLogger(__name__)
 AUDIO_SAVE_NORM = Path("audio_files/normalized")
 AUDIO_SAVE_NORM.mkdir(parents=True, exist_ok=True)
 
+VIDEO_EXTENSIONS = [".mp4", ".mov", ".mkv"]
+
 
 
 class SpeechRecognizerFast:
@@ -33,35 +37,43 @@ class SpeechRecognizerFast:
     batch_size = 5  # Увеличен для faster-whisper, так как он более оптимизирован
     _summarizer_cache = None
 
+    # Время последнего использования модели; выгрузкой по простою и
+    # по нехватке памяти управляет ModelGovernor (model_governor.py)
     _last_use_time = 0
-    _cleanup_delay = 600  # 10 минут
     _lock = threading.Lock()
 
     _active_tasks = 0
 
 
-    # Инициализируем менеджер один раз
+    # Инициализируем менеджер один раз. GPU определяется через ctranslate2:
+    # запросы к torch.cuda создают контекст CUDA, который занимает видеопамять
+    _has_cuda = ctranslate2.get_cuda_device_count() > 0
     _model_manager = WhisperModelManager(
-        device="cuda" if torch.cuda.is_available() else "cpu",
-        compute_type="float16" if torch.cuda.is_available() else "int8"
+        device="cuda" if _has_cuda else "cpu",
+        compute_type="float16" if _has_cuda else "int8"
     )
 
 
-    @staticmethod
-    def _log_devices():
+    @classmethod
+    def _log_devices(cls):
         """Вывод информации об устройствах."""
-        if torch.cuda.is_available():
-            logger.info(f"CUDA доступна: {torch.cuda.get_device_name(0)}")
+        if cls._has_cuda:
+            logger.info("CUDA доступна: устройств %d",
+                        ctranslate2.get_cuda_device_count())
         else:
             logger.info("CUDA не доступна. Используется CPU.")
 
     @staticmethod
-    def preprocess_audio(input_path: Path, output_path: Path) -> Path:
-        """Преобразует аудиофайл (ogg, mp3, wav, flac и т.п.) → wav, нормализует и добавляет тишину."""
+    def preprocess_audio(input_path: Path, output_path: Path, keep_input: bool = False) -> Path:
+        """Преобразует аудиофайл (ogg, mp3, wav, flac и т.п.) → wav, нормализует и добавляет тишину.
+
+        При keep_input=True исходный файл не удаляется (нужно, например,
+        для повторной доставки задачи другому воркеру).
+        """
         if not input_path.exists():
             raise FileNotFoundError(f"Файл не найден: {input_path}")
 
-        logger.info(f"Обработка файла: {input_path}")
+        logger.info("Обработка файла: %s", input_path)
 
         # Определяем формат по расширению или MIME-типу
         ext = input_path.suffix.lower().replace('.', '')
@@ -93,44 +105,150 @@ class SpeechRecognizerFast:
         output_path.parent.mkdir(parents=True, exist_ok=True)
         audio.export(output_path, format="wav")
 
-        logger.info(f"Сохранено нормализованное аудио: {output_path}")
+        logger.info("Сохранено нормализованное аудио: %s", output_path)
 
-        # Удаляем исходный файл 
-        input_path.unlink(missing_ok=True)
+        # Удаляем исходный файл
+        if not keep_input:
+            input_path.unlink(missing_ok=True)
 
         return output_path
 
+    @staticmethod
+    def extract_audio_from_video(video_path: Path) -> Optional[Path]:
+        """Извлекает аудио из видеофайла с помощью ffmpeg и возвращает путь к .wav.
+
+        WAV пишется во временный файл в AUDIO_SAVE_NORM, а не рядом с
+        исходником: каталог с видео может быть только для чтения или уже
+        содержать одноимённый .wav.
+        """
+        audio_path = AUDIO_SAVE_NORM / \
+            f"{video_path.stem}_{uuid.uuid4().hex[:8]}.wav"
+        try:
+            subprocess.run(
+                [
+                    "ffmpeg",
+                    "-y",  # перезаписывать без запроса
+                    "-i", str(video_path),
+                    "-vn",  # без видео
+                    "-acodec", "pcm_s16le",  # несжатый WAV
+                    "-ar", "16000",  # частота дискретизации
+                    "-ac", "1",  # моно
+                    str(audio_path)
+                ],
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            return audio_path
+        except subprocess.CalledProcessError as e:
+            logger.error("Ошибка при извлечении аудио из видео: %s", e)
+            audio_path.unlink(missing_ok=True)
+            return None
+
+    @classmethod
+    def transcribe(
+        cls,
+        file_path: Path,
+        keep_input: bool = False,
+        on_segment: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """Распознаёт аудио- или видеофайл (для видео сначала извлекается звук).
+
+        Возвращает словарь с текстом, сегментами и длительностью аудио
+        (см. transcribe_segments).
+        """
+        file_path = Path(file_path)
+        if file_path.suffix.lower() not in VIDEO_EXTENSIONS:
+            return cls.transcribe_segments(
+                str(file_path), keep_input=keep_input, on_segment=on_segment)
+
+        with span("extract_audio"):
+            audio_path = cls.extract_audio_from_video(file_path)
+        if not audio_path or not audio_path.exists():
+            raise RuntimeError("Ошибка при извлечении аудио из видео.")
+        try:
+            return cls.transcribe_segments(str(audio_path), on_segment=on_segment)
+        finally:
+            audio_path.unlink(missing_ok=True)
+            if not keep_input:
+                file_path.unlink(missing_ok=True)
+
     @classmethod
-    def transcribe_audio(cls, input_path: str) -> str:
+    def transcribe_file(cls, file_path: Path, keep_input: bool = False) -> str:
+        """Распознаёт аудио- или видеофайл и возвращает текст."""
+        return cls.transcribe(file_path, keep_input=keep_input)["text"]
+
+    @classmethod
+    def transcribe_audio(cls, input_path: str, keep_input: bool = False) -> str:
         """Распознаёт речь из аудиофайла и возвращает текст."""
+        return cls.transcribe_segments(input_path, keep_input=keep_input)["text"]
+
+    @classmethod
+    def transcribe_segments(
+        cls,
+        input_path: str,
+        keep_input: bool = False,
+        on_segment: Optional[Callable[[dict], None]] = None
+    ) -> dict:
+        """Распознаёт речь из аудиофайла по сегментам.
+
+        on_segment вызывается для каждого сегмента сразу после декодирования
+        (для потоковой отдачи). Возвращает словарь:
+        {"text": str, "segments": [{"start", "end", "text"}], "audio_duration": float}.
+        """
         with cls._lock:
             cls._active_tasks += 1
 
-        cls._log_devices()
+        if not cls.is_model_loaded():
+            cls._log_devices()
 
         input_path = Path(input_path)
-        wav_path = AUDIO_SAVE_NORM / f"{input_path.stem}.wav"
-        cls.preprocess_audio(input_path, wav_path)
+        # Уникальное имя: несколько воркеров пишут в общий каталог
+        wav_path = AUDIO_SAVE_NORM / \
+            f"{input_path.stem}_{uuid.uuid4().hex[:8]}.wav"
 
         try:
+            with span("preprocess_audio"):
+                cls.preprocess_audio(
+                    input_path, wav_path, keep_input=keep_input)
+
             # model = cls._get_model()
             # Получаем модель через менеджер
             model = cls._model_manager.get_model()
             # Транскрибация с faster-whisper
-            segments, info = model.transcribe(
-                str(wav_path),
-                beam_size=5,
-                language="ru",
-                # batch_size=cls.batch_size
-            )
+            with span("model.features"):
+                segments, info = model.transcribe(
+                    str(wav_path),
+                    beam_size=5,
+                    language="ru",
+                    # batch_size=cls.batch_size
+                )
+
+            # Сегменты декодируются лениво, по мере итерации
+            result_segments = []
+            with span("model.decode", audio_duration=info.duration) as attrs:
+                for segment in segments:
+                    item = {
+                        "start": round(segment.start, 2),
+                        "end": round(segment.end, 2),
+                        "text": segment.text.strip(),
+                    }
+                    result_segments.append(item)
+                    if on_segment is not None:
+                        on_segment(item)
+                attrs["segments"] = len(result_segments)
 
             # Объединяем текст из сегментов
-            text = " ".join(segment.text for segment in segments).strip()
-            logger.info(f"Распознанный текст ({len(text)} символов)")
+            text = " ".join(item["text"] for item in result_segments).strip()
+            logger.info("Распознанный текст (%s символов)", len(text))
 
             # if (model is not None):
             #     logger.info(f"модель не пуская")
-            return text
+            return {
+                "text": text,
+                "segments": result_segments,
+                "audio_duration": info.duration,
+            }
 
         finally:
             # Удаляем временный WAV-файл
@@ -139,8 +257,59 @@ class SpeechRecognizerFast:
             # отмечаем завершение задачи
             with cls._lock:
                 cls._active_tasks -= 1
-                cls._touch_activity()
+                cls._last_use_time = time.time()
+
+    @classmethod
+    def is_model_loaded(cls) -> bool:
+        """Загружена ли модель в память."""
+        return cls._model_manager.is_loaded()
+
+    @classmethod
+    def model_load_error(cls) -> Optional[str]:
+        """Ошибка последней загрузки модели; None, если модель загружается."""
+        return cls._model_manager.load_error
+
+    @classmethod
+    def get_activity(cls) -> tuple:
+        """Количество активных задач и время последнего использования модели."""
+        with cls._lock:
+            return cls._active_tasks, cls._last_use_time
 
+    @classmethod
+    def release_model(cls, downgrade: bool = False) -> Optional[str]:
+        """Выгружает модель (или переключает на облегчённый compute_type),
+        только если сейчас нет активных задач.
+
+        Возвращает "downgrade", "unload" или None, если модель занята.
+        """
+        with cls._lock:
+            # Задача увеличивает счётчик под этим же замком до get_model(),
+            # поэтому модель не выгрузится посреди распознавания
+            if cls._active_tasks > 0:
+                return None
+            if downgrade and cls._model_manager.downgrade():
+                return "downgrade"
+            cls._model_manager.cleanup()
+            return "unload"
+
+    @classmethod
+    def restore_compute_type(cls) -> bool:
+        """Возвращает исходный compute_type, если модель выгружена и задач нет."""
+        with cls._lock:
+            if cls._active_tasks > 0:
+                return False
+            return cls._model_manager.restore()
+
+    @classmethod
+    def warmup(cls):
+        """Заранее загружает модель в память."""
+        try:
+            cls._model_manager.get_model()
+        except Exception as e:
+            logger.error("Ошибка прогрева модели: %s", e)
+            return
+        with cls._lock:
+            cls._last_use_time = time.time()
 
     @classmethod
     def summarize_text(cls, text: str, max_length: int = 60) -> Optional[str]:
@@ -159,62 +328,3 @@ class SpeechRecognizerFast:
         summary = summarizer(text, max_length=max_length,
                              min_length=10, do_sample=False)
         return summary[0]["summary_text"].strip()
-
-    @classmethod
-    def _touch_activity(cls):
-        """Обновляет время последнего использования и перезапускает таймер очистки."""
-        with cls._lock:
-            cls._last_use_time = time.time()
-            cls._start_cleanup_timer()
-
-    @classmethod
-    def _start_cleanup_timer(cls):
-        """Безопасно перезапускает таймер очистки."""
-        # Завершить старый таймер
-        if cls._cleanup_timer and cls._cleanup_timer.is_alive():
-            cls._cleanup_timer.cancel()
-            cls._cleanup_timer = None
-
-        cls._cleanup_timer = threading.Timer(
-            cls._cleanup_delay, cls._try_cleanup)
-        cls._cleanup_timer.daemon = True
-        cls._cleanup_timer.start()
-
-    @classmethod
-    def _try_cleanup(cls):
-        """Проверяет, прошло ли достаточно времени без активности, и выгружает модель."""
-
-        with cls._lock:
-
-            if cls._active_tasks > 0:
-                logger.info("Не выгружаю модель — есть активные задачи.")
-                return
-
-            idle_time = time.time() - cls._last_use_time
-            if idle_time < cls._cleanup_delay:
-                # Активность была недавно — переносим очистку
-                remaining = cls._cleanup_delay - idle_time
-                logger.info(
-                    f"⏰ Новая активность — перенос очистки через {remaining:.1f} сек.")
-                cls._cleanup_timer = threading.Timer(
-                    remaining, cls._try_cleanup)
-                cls._cleanup_timer.daemon = True
-                cls._cleanup_timer.start()
-                return
-
-            # Очистка модели
-            logger.info(
-                "⏳ 10 минут без активности — освобождаю модель из памяти...")
-            try:
-                cls._model_manager.cleanup()
-            except Exception as e:
-                logger.warning(f"Ошибка при очистке модели: {e}")
-
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
-
-
-
-            logger.info("✅ Модель успешно выгружена из памяти.")
-            cls._cleanup_timer = None
@@ -0,0 +1,184 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from queue import Queue
+from typing import Optional
+
+
+# Логгер для записей о стадиях задачи (spans); пишется в отдельный файл
+trace_logger = logging.getLogger("trace")
+trace_logger.propagate = False
+
+_trace_id = contextvars.ContextVar("trace_id", default="-")
+
+_known_threads = set()
+_known_threads_lock = threading.Lock()
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def get_trace_id() -> str:
+    return _trace_id.get()
+
+
+@contextmanager
+def trace_context(trace_id: str):
+    """Привязывает trace_id ко всем записям журнала внутри блока."""
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Замеряет стадию задачи и пишет её в журнал трассировки.
+
+    Ошибка внутри блока сохраняется в атрибутах и пробрасывается дальше.
+    """
+    start = time.time()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record_span(name, start, time.time(), **attrs)
+
+
+def record_span(name: str, start: float, end: float, **attrs):
+    """Пишет стадию с известными началом и концом (например, ожидание в очереди)."""
+    if not trace_logger.isEnabledFor(logging.INFO):
+        return
+    tid = threading.get_native_id()
+    events = []
+    with _known_threads_lock:
+        if tid not in _known_threads:
+            _known_threads.add(tid)
+            # Имя потока для просмотрщика
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(),
+                           "tid": tid, "args": {"name": threading.current_thread().name}})
+    events.append({
+        "name": name,
+        "cat": "job",
+        "ph": "X",
+        "ts": int(start * 1_000_000),
+        "dur": max(0, int((end - start) * 1_000_000)),
+        "pid": os.getpid(),
+        "tid": tid,
+        "args": {"trace_id": get_trace_id(), **attrs},
+    })
+    for event in events:
+        trace_logger.info("span", extra={"trace_event": event})
+
+
+class TraceIdFilter(logging.Filter):
+    """Добавляет в запись журнала trace_id текущей задачи."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = _trace_id.get()
+        return True
+
+
+class TraceEventFormatter(logging.Formatter):
+    """Событие в формате Chrome Trace Event (JSON Array Format)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.trace_event, ensure_ascii=False) + ","
+
+
+class TraceFileHandler(RotatingFileHandler):
+    """Файл трассировки, который открывается в Perfetto / chrome://tracing.
+
+    Каждый файл начинается с «[»; закрывающая скобка в этом формате
+    необязательна, поэтому файл читается и во время записи.
+    """
+
+    def _open(self):
+        stream = super()._open()
+        if stream.tell() == 0:
+            stream.write("[\n")
+        return stream
+
+
+def setup_logging(
+    log_dir: str,
+    log_file: Optional[str] = "app.log",
+    trace_file: Optional[str] = "traces.json",
+    level: int = logging.INFO
+) -> QueueListener:
+    """Настраивает журнал через очередь: запись на диск идёт в отдельном потоке.
+
+    Обработчики кода (polling, воркер, модель) только кладут запись в
+    очередь и не ждут диск. Возвращает запущенный QueueListener.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = logging.Formatter(
+        "%(asctime)s [%(levelname)s] %(name)s [%(trace_id)s]: %(message)s")
+
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(RotatingFileHandler(
+            os.path.join(log_dir, log_file),
+            maxBytes=5_000_000,
+            backupCount=5,
+            encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    trace_handlers = []
+    if trace_file:
+        trace_handler = TraceFileHandler(
+            os.path.join(log_dir, trace_file),
+            maxBytes=20_000_000,
+            backupCount=5,
+            encoding="utf-8"
+        )
+        trace_handler.setFormatter(TraceEventFormatter())
+        trace_handlers.append(trace_handler)
+
+    log_queue = Queue(-1)
+    queue_handler = QueueHandler(log_queue)
+    # trace_id нужно взять в потоке, где создана запись, а не в потоке записи
+    queue_handler.addFilter(TraceIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+
+    trace_logger.handlers = []
+    if trace_handlers:
+        trace_logger.addHandler(queue_handler)
+        trace_logger.setLevel(logging.INFO)
+    else:
+        trace_logger.setLevel(logging.WARNING)
+
+    listener = _RoutingListener(log_queue, handlers, trace_handlers)
+    listener.start()
+    return listener
+
+
+class _RoutingListener(QueueListener):
+    """Записи трассировки — в файл трассировки, остальные — в обычный журнал."""
+
+    def __init__(self, queue, handlers: list, trace_handlers: list):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.trace_handlers = trace_handlers
+
+    def handle(self, record: logging.LogRecord):
+        if hasattr(record, "trace_event"):
+            for handler in self.trace_handlers:
+                handler.handle(record)
+            return
+        super().handle(record)
@@ -0,0 +1,189 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Как часто удалять устаревшие расшифровки, сек.
+PURGE_INTERVAL = 3600
+
+
+class TranscriptStore:
+    """Архив расшифровок в SQLite с полнотекстовым поиском (FTS5).
+
+    Хранит текст и сегменты с таймкодами по каждому чату, чтобы старую
+    расшифровку можно было найти (/search) и получить повторно (/get)
+    без запуска модели. Расшифровки старше retention_days удаляются;
+    retention_days=0 — хранить бессрочно.
+    """
+
+    def __init__(self, db_path: str, retention_days: float = 0):
+        self.db_path = Path(db_path)
+        self.retention_days = retention_days
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._init_db()
+        self.purge_expired()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS transcripts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chat_id INTEGER NOT NULL,
+                    file_name TEXT,
+                    file_unique_id TEXT,
+                    text TEXT NOT NULL,
+                    audio_duration REAL,
+                    processing_time REAL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS transcripts_chat
+                    ON transcripts(chat_id, created_at);
+                CREATE INDEX IF NOT EXISTS transcripts_file
+                    ON transcripts(chat_id, file_unique_id);
+
+                CREATE TABLE IF NOT EXISTS segments (
+                    transcript_id INTEGER NOT NULL
+                        REFERENCES transcripts(id) ON DELETE CASCADE,
+                    idx INTEGER NOT NULL,
+                    start REAL NOT NULL,
+                    end REAL NOT NULL,
+                    text TEXT NOT NULL,
+                    PRIMARY KEY (transcript_id, idx)
+                );
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+                    text, content='transcripts', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS transcripts_ai AFTER INSERT ON transcripts BEGIN
+                    INSERT INTO transcripts_fts(rowid, text) VALUES (new.id, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS transcripts_ad AFTER DELETE ON transcripts BEGIN
+                    INSERT INTO transcripts_fts(transcripts_fts, rowid, text)
+                        VALUES ('delete', old.id, old.text);
+                END;
+            """)
+
+    def save(
+        self,
+        chat_id: int,
+        result: dict,
+        processing_time: Optional[float] = None,
+        file_name: Optional[str] = None,
+        file_unique_id: Optional[str] = None
+    ) -> int:
+        """Сохраняет результат распознавания и возвращает id расшифровки."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            cur = conn.execute(
+                "INSERT INTO transcripts (chat_id, file_name, file_unique_id, text, "
+                "audio_duration, processing_time, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, file_name, file_unique_id, result["text"],
+                 result.get("audio_duration"), processing_time, time.time())
+            )
+            transcript_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO segments (transcript_id, idx, start, end, text) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(transcript_id, i, s["start"], s["end"], s["text"])
+                 for i, s in enumerate(result.get("segments", []))]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        logger.info("Расшифровка #%s сохранена для %s", transcript_id, chat_id)
+        if time.time() - self._last_purge > PURGE_INTERVAL:
+            self.purge_expired()
+        return transcript_id
+
+    def get(self, transcript_id: int, chat_id: int) -> Optional[dict]:
+        """Расшифровка с сегментами; только из истории указанного чата."""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT * FROM transcripts WHERE id = ? AND chat_id = ?",
+                (transcript_id, chat_id)
+            ).fetchone()
+            if row is None:
+                return None
+            segments = conn.execute(
+                "SELECT start, end, text FROM segments "
+                "WHERE transcript_id = ? ORDER BY idx",
+                (transcript_id,)
+            ).fetchall()
+        transcript = dict(row)
+        transcript["segments"] = [dict(s) for s in segments]
+        return transcript
+
+    def find_by_file(self, chat_id: int, file_unique_id: str) -> Optional[dict]:
+        """Ранее сохранённая расшифровка того же файла Telegram."""
+        if not file_unique_id:
+            return None
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT id FROM transcripts WHERE chat_id = ? AND file_unique_id = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (chat_id, file_unique_id)
+            ).fetchone()
+        return self.get(row["id"], chat_id) if row else None
+
+    def search(self, chat_id: int, query: str, limit: int = 5) -> list:
+        """Полнотекстовый поиск по истории чата; возвращает id, дату и фрагмент."""
+        words = query.split()
+        if not words:
+            return []
+        # Каждое слово в кавычках: пользовательский ввод не разбирается как
+        # синтаксис FTS5. Поиск по префиксу находит другие словоформы
+        match = " ".join('"' + w.replace('"', '""') + '"*' for w in words)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT t.id, t.created_at, t.file_name, "
+                "snippet(transcripts_fts, 0, '«', '»', '…', 16) AS snippet "
+                "FROM transcripts_fts JOIN transcripts t ON t.id = transcripts_fts.rowid "
+                "WHERE transcripts_fts MATCH ? AND t.chat_id = ? "
+                "ORDER BY bm25(transcripts_fts) LIMIT ?",
+                (match, chat_id, limit)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def purge_expired(self) -> int:
+        """Удаляет расшифровки старше срока хранения."""
+        with self._purge_lock:
+            self._last_purge = time.time()
+            if not self.retention_days:
+                return 0
+            cutoff = time.time() - self.retention_days * 86400
+            with closing(self._connect()) as conn:
+                cur = conn.execute(
+                    "DELETE FROM transcripts WHERE created_at < ?", (cutoff,))
+        if cur.rowcount:
+            logger.info("Удалено устаревших расшифровок: %s", cur.rowcount)
+        return cur.rowcount
+
+
+def store_from_env() -> TranscriptStore:
+    """Создаёт архив расшифровок с настройками из переменных окружения."""
+    return TranscriptStore(
+        os.getenv("TRANSCRIPTS_DB_PATH", "audio_files/transcripts.db"),
+        retention_days=float(os.getenv("TRANSCRIPT_RETENTION_DAYS", "90"))
+    )
@@ -19,7 +19,7 @@ class UserManager:
                 data = json.load(f)
                 return set(data)
         except Exception as e:
-            logger.error(f"Ошибка загрузки списка пользователей: {e}")
+            logger.error("Ошибка загрузки списка пользователей: %s", e)
             return set()
 
     def _save_users(self):
@@ -28,7 +28,7 @@ class UserManager:
                 json.dump(list(self.allowed_users), f,
                           ensure_ascii=False, indent=2)
         except Exception as e:
-            logger.error(f"Ошибка сохранения списка пользователей: {e}")
+            logger.error("Ошибка сохранения списка пользователей: %s", e)
 
     def is_allowed(self, user_id: int) -> bool:
         return user_id in self.allowed_users
@@ -36,7 +36,7 @@ class UserManager:
     def add_user(self, user_id: int):
         self.allowed_users.add(user_id)
         self._save_users()
-        logger.info(f"Добавлен новый пользователь: {user_id}")
+        logger.info("Добавлен новый пользователь: %s", user_id)
 
     def list_users(self):
         return list(self.allowed_users)
@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from job_broker import JobBroker, broker_from_env
+from model_governor import governor_from_env
+from profiler import SamplingProfiler
+from speech_recognizer_fast import SpeechRecognizerFast
+from tracing import record_span, setup_logging, span, trace_context
+
+
+logger = logging.getLogger("worker")
+
+POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+# Сколько задача может идти без нового сегмента, прежде чем её отдадут
+# другому воркеру; учитывает загрузку модели и предобработку длинных файлов
+STALL_TIMEOUT = float(os.getenv("JOB_STALL_TIMEOUT", "900"))
+# Длительность профилирования по SIGUSR1, сек.
+PROFILE_SECONDS = float(os.getenv("WORKER_PROFILE_SECONDS", "30"))
+
+
+def _heartbeat_loop(
+    broker: JobBroker,
+    job_id: str,
+    worker_id: str,
+    progress: dict,
+    stop: threading.Event
+):
+    """Продлевает аренду задачи, пока распознавание продвигается.
+
+    Прогресс — время последнего готового сегмента (или начала задачи).
+    Если его нет дольше STALL_TIMEOUT, аренда больше не продлевается:
+    она истечёт, и задачу получит другой воркер.
+    """
+    interval = max(broker.lease_timeout / 3, 1)
+    while not stop.wait(interval):
+        stalled = time.time() - progress["time"]
+        if stalled > STALL_TIMEOUT:
+            logger.error(
+                "Задача %s без прогресса %.0f сек. — аренда не продлевается.",
+                job_id, stalled)
+            return
+        if not broker.heartbeat(job_id, worker_id):
+            logger.warning("Аренда задачи %s потеряна.", job_id)
+            return
+
+
+def process_job(broker: JobBroker, job: dict, worker_id: str):
+    """Распознаёт файл задачи и сохраняет результат в брокере."""
+    job_id = job["id"]
+    file_path = Path(job["file_path"])
+
+    start_time = time.time()
+    progress = {"time": start_time}
+
+    def on_segment(segment: dict):
+        progress["time"] = time.time()
+
+    stop = threading.Event()
+    heartbeat = threading.Thread(
+        target=_heartbeat_loop,
+        args=(broker, job_id, worker_id, progress, stop),
+        daemon=True)
+    heartbeat.start()
+
+    record_span("queue_wait", job["created_at"], start_time,
+                attempt=job["attempts"])
+    finished = False
+    try:
+        if not file_path.exists():
+            raise FileNotFoundError(f"Файл не найден: {file_path}")
+
+        # Исходник не удаляем до завершения: при падении воркера
+        # задача будет выдана повторно и файл понадобится снова
+        with span("transcribe", source=job["source"], worker_id=worker_id):
+            result = SpeechRecognizerFast.transcribe(
+                file_path, keep_input=True, on_segment=on_segment)
+        duration = time.time() - start_time
+        result["duration"] = duration
+        finished = broker.complete(job_id, worker_id, result)
+        if finished:
+            logger.info("Задача %s выполнена за %.2f сек.", job_id, duration)
+    except Exception as e:
+        logger.exception("Ошибка в задаче %s", job_id)
+        finished = broker.fail(job_id, worker_id, str(e))
+    finally:
+        stop.set()
+        # Если задача уже у другого воркера, файл нужен ему
+        if finished:
+            file_path.unlink(missing_ok=True)
+
+
+def _run_profile(log_dir: str, worker_id: str):
+    """Профилирует воркер и сохраняет стеки в <log_dir>/profiles."""
+    try:
+        profiler = SamplingProfiler().run(PROFILE_SECONDS)
+    except RuntimeError as e:
+        logger.warning("%s", e)
+        return
+    path = profiler.save(Path(log_dir) / "profiles", prefix=f"profile_{worker_id}")
+    logger.info("Профиль сохранён: %s\n%s", path, profiler.summary())
+
+
+def run_worker():
+    load_dotenv()
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    # Журнал — в stdout контейнера, стадии задач — в свой файл на воркер
+    log_dir = os.getenv("LOG_DIR", "/app/logs")
+    log_listener = setup_logging(
+        log_dir,
+        log_file=None,
+        trace_file=f"traces_{worker_id}.json"
+    )
+    # При выходе дописать записи, оставшиеся в очереди
+    atexit.register(log_listener.stop)
+
+    # /profile в боте видит только фронтенд; воркер профилируется по сигналу:
+    #   docker compose kill -s SIGUSR1 worker
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+        target=_run_profile, args=(log_dir, worker_id),
+        daemon=True, name="profiler").start())
+
+    broker = broker_from_env()
+    if broker is None:
+        raise ValueError("Переменная JOB_BROKER_PATH не найдена в .env")
+
+    logger.info("Воркер %s запущен, брокер: %s", worker_id, broker.db_path)
+
+    governor_from_env(SpeechRecognizerFast).start()
+
+    while True:
+        try:
+            job = broker.claim(worker_id)
+        except Exception as e:
+            logger.error("Ошибка брокера: %s", e)
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        if job is None:
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        # Ошибка брокера при сохранении результата (например, база
+        # заблокирована) не должна завершать процесс: задача вернётся
+        # в очередь по истечении аренды
+        try:
+            with trace_context(job["id"]):
+                process_job(broker, job, worker_id)
+        except Exception:
+            logger.exception("Необработанная ошибка задачи %s", job["id"])
+            time.sleep(POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    run_worker()